@@ -0,0 +1,439 @@
+import os
+import time
+import asyncio
+import argparse
+from collections import OrderedDict
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest
+from aiogram.methods import SendMessage, EditMessageText
+
+from metrics import stage_timer
+
+# Telegram: не больше ~1 сообщения в секунду в один чат (короткие всплески допустимы)
+RATE_PER_SECOND = 1.0
+BURST = 3
+# Событий в одном дайджесте и лимит длины сообщения Telegram
+MAX_DIGEST_EVENTS = 20
+MAX_MESSAGE_LENGTH = 4096
+# Больше неотправленных событий не копим: самые старые выбрасываются
+MAX_PENDING = 1000
+# Сколько отправленных сообщений помнить для последующих правок
+MAX_TRACKED = 2000
+DIGEST_SEPARATOR = "\n\n"
+# Попыток отправить событие при сетевых ошибках и пауза перед повтором (сек)
+MAX_SEND_ATTEMPTS = 3
+ERROR_BACKOFF = 1.0
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity в запасе."""
+
+    def __init__(self, rate: float = RATE_PER_SECOND, capacity: int = BURST, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """Сколько секунд ждать до следующего токена (0 — есть сейчас)."""
+        self._refill()
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self.delay()
+            if wait <= 0:
+                self._tokens -= 1
+                return
+            await asyncio.sleep(wait)
+
+    def penalize(self, seconds: float):
+        """Ответ RetryAfter от Telegram: токенов не будет еще seconds секунд."""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+
+class _SentMessage:
+    """Отправленное сообщение: одно событие или дайджест из нескольких."""
+
+    def __init__(self, events):
+        self.events = events
+        self.message_id = None
+        # Правка пришла, пока сообщение отправлялось
+        self.dirty = False
+
+    def text(self):
+        return render_digest(self.events)
+
+
+def render_digest(events):
+    if len(events) == 1:
+        return events[0]
+    return f"📬 Событий: {len(events)}{DIGEST_SEPARATOR}" + DIGEST_SEPARATOR.join(events)
+
+
+class AdminNotifier:
+    """Очередь сообщений админу с ограничением частоты.
+
+    Хендлеры не ждут Telegram: send() и edit() только ставят событие в
+    очередь, а фоновая задача отправляет их не чаще rate в секунду.
+    Если к моменту отправки накопилось несколько событий, они уходят одним
+    дайджестом. Правка еще не отправленного события просто заменяет его
+    текст (send + edit = одно сообщение), правка отправленного — edit_message_text
+    этого сообщения (или дайджеста, в котором оно было).
+
+    Тексты уходят без parse_mode: в них есть пользовательский ввод, и
+    символы вроде < и & при HTML-разметке по умолчанию ломали бы запрос.
+    Если Telegram все же отклонил дайджест, его события отправляются по
+    одному, чтобы одно плохое событие не потянуло за собой остальные.
+
+    bot передается в start(): подойдет любой объект с методами
+    send_message(chat_id, text, parse_mode) и edit_message_text(text, chat_id, message_id, parse_mode).
+    """
+
+    def __init__(self, chat_id, rate: float = RATE_PER_SECOND, burst: int = BURST,
+                 max_digest: int = MAX_DIGEST_EVENTS, max_pending: int = MAX_PENDING):
+        self.chat_id = chat_id
+        self.bucket = TokenBucket(rate, burst)
+        self.max_digest = max(1, max_digest)
+        self.max_pending = max_pending
+        self.bot = None
+        # Префикс ключей: ключи прошлого запуска (из сохраненного FSM) не совпадут с новыми
+        self._prefix = os.urandom(4).hex()
+        self._counter = 0
+        # Ключ события -> текст (еще не отправлено)
+        self._pending = OrderedDict()
+        # Отправленные сообщения с ожидающей правкой
+        self._pending_edits = OrderedDict()
+        # Ключ события -> (сообщение, номер события в нем)
+        self._sent = OrderedDict()
+        # События, которые отправляются только по одному (дайджест с ними отклонен)
+        self._solo = set()
+        # Ключ события -> число неудачных попыток отправки
+        self._attempts = {}
+        self._wakeup = None
+        self._worker = None
+        self.stats = {"events": 0, "edits": 0, "collapsed": 0, "messages": 0,
+                      "digests": 0, "api_edits": 0, "dropped": 0, "errors": 0, "retry_after": 0}
+
+    @property
+    def enabled(self):
+        return self.chat_id is not None
+
+    def start(self, bot):
+        """Запускает фоновую отправку (вызывается в on_startup)."""
+        self.bot = bot
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._wakeup = self._wakeup or asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+
+    def queue_size(self):
+        """События и правки, ожидающие отправки (для метрик)."""
+        return len(self._pending) + len(self._pending_edits)
+
+    # --- Интерфейс хендлеров (не блокирует) ---
+
+    def send(self, text: str):
+        """Ставит сообщение админу в очередь. Возвращает ключ для edit() или None."""
+        if not self.enabled:
+            return None
+        self._counter += 1
+        key = f"{self._prefix}:{self._counter}"
+        self._pending[key] = text
+        self.stats["events"] += 1
+        if len(self._pending) > self.max_pending:
+            self._pending.popitem(last=False)
+            self.stats["dropped"] += 1
+        self._notify()
+        return key
+
+    def edit(self, key, text: str):
+        """Заменяет текст события. Неизвестный ключ (например, после рестарта) — новое сообщение."""
+        if not self.enabled:
+            return None
+        self.stats["edits"] += 1
+        if key in self._pending:
+            # Сообщение еще не ушло: отправится сразу исправленный текст
+            self._pending[key] = text
+            self.stats["collapsed"] += 1
+            return key
+        if key in self._sent:
+            message, index = self._sent[key]
+            message.events[index] = text
+            if message.message_id is None:
+                # Сообщение сейчас отправляется: правка уйдет следом
+                message.dirty = True
+            else:
+                # Несколько правок одного сообщения до отправки — один вызов API
+                self._pending_edits[id(message)] = message
+                self._notify()
+            return key
+        return self.send(text)
+
+    def _notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if self.bot is not None:
+            self._ensure_worker()
+
+    # --- Фоновая отправка ---
+
+    def _take_digest(self):
+        """Снимает с очереди события для одного сообщения (не длиннее лимита Telegram)."""
+        keys, events, length = [], [], 0
+        while self._pending and len(events) < self.max_digest:
+            key, text = next(iter(self._pending.items()))
+            added = len(text) + len(DIGEST_SEPARATOR)
+            if events and (length + added > MAX_MESSAGE_LENGTH - 100 or key in self._solo):
+                break
+            self._pending.popitem(last=False)
+            keys.append(key)
+            events.append(text[:MAX_MESSAGE_LENGTH - 100])
+            length += added
+            if key in self._solo:
+                break
+        return keys, events
+
+    async def _run(self):
+        while True:
+            if not self._pending and not self._pending_edits:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            # Токен берется до выбора событий: пока ждем, очередь успевает накопиться в дайджест
+            await self.bucket.acquire()
+            if self._pending_edits:
+                _, message = self._pending_edits.popitem(last=False)
+                await self._deliver_edit(message)
+            elif self._pending:
+                keys, events = self._take_digest()
+                await self._deliver(keys, events)
+
+    async def _deliver(self, keys, events):
+        message = _SentMessage(events)
+        # Регистрируем до отправки: правки во время запроса попадут в message
+        for index, key in enumerate(keys):
+            self._sent[key] = (message, index)
+        try:
+            with stage_timer("admin_send"):
+                result = await self.bot.send_message(chat_id=self.chat_id, text=message.text(), parse_mode=None)
+        except Exception as e:
+            for key in keys:
+                self._sent.pop(key, None)
+            if isinstance(e, TelegramRetryAfter):
+                self._requeue(keys, message.events)
+                self._retry_after(e.retry_after)
+            elif isinstance(e, TelegramBadRequest) and len(keys) > 1:
+                # Дайджест отклонен целиком: события пробуем по одному
+                self._solo.update(keys)
+                self._requeue(keys, message.events)
+            else:
+                self._failed(keys, message.events, e)
+            return
+        for key in keys:
+            self._solo.discard(key)
+            self._attempts.pop(key, None)
+        message.message_id = result.message_id
+        self.stats["messages"] += 1
+        if len(events) > 1:
+            self.stats["digests"] += 1
+        if message.dirty:
+            self._pending_edits[id(message)] = message
+        while len(self._sent) > MAX_TRACKED:
+            self._sent.popitem(last=False)
+
+    async def _deliver_edit(self, message):
+        try:
+            with stage_timer("admin_edit"):
+                await self.bot.edit_message_text(text=message.text(), chat_id=self.chat_id,
+                                                 message_id=message.message_id, parse_mode=None)
+            self.stats["api_edits"] += 1
+        except TelegramRetryAfter as e:
+            self._pending_edits[id(message)] = message
+            self._retry_after(e.retry_after)
+        except TelegramBadRequest as e:
+            # Например, "message is not modified" или сообщение удалено
+            self.stats["errors"] += 1
+            print(f"Ошибка правки сообщения админу: {e}")
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Ошибка правки сообщения админу: {e}")
+
+    def _failed(self, keys, events, error):
+        """Ошибка отправки: отклоненное событие выбрасывается, сетевая ошибка — повтор (до MAX_SEND_ATTEMPTS)."""
+        self.stats["errors"] += 1
+        print(f"Ошибка отправки админу: {error}")
+        if isinstance(error, TelegramBadRequest):
+            retry = []
+        else:
+            retry = [(key, text) for key, text in zip(keys, events)
+                     if self._attempts.get(key, 0) + 1 < MAX_SEND_ATTEMPTS]
+            for key, _ in retry:
+                self._attempts[key] = self._attempts.get(key, 0) + 1
+            self.bucket.penalize(ERROR_BACKOFF)
+        retried = {key for key, _ in retry}
+        for key in keys:
+            if key not in retried:
+                self._solo.discard(key)
+                self._attempts.pop(key, None)
+                self.stats["dropped"] += 1
+        if retry:
+            self._requeue([key for key, _ in retry], [text for _, text in retry])
+
+    def _requeue(self, keys, events):
+        """Возвращает события в начало очереди (тексты уже с правками, пришедшими за время отправки)."""
+        restored = OrderedDict(zip(keys, events))
+        restored.update(self._pending)
+        self._pending = restored
+
+    def _retry_after(self, seconds):
+        self.stats["retry_after"] += 1
+        print(f"⚠️ Telegram просит подождать {seconds} с перед сообщениями админу")
+        self.bucket.penalize(seconds)
+
+    async def close(self, timeout: float = 5.0):
+        """Пытается дослать очередь за timeout секунд и останавливает отправку."""
+        if self._worker is None:
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (self._pending or self._pending_edits) and not self._worker.done() and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        if self._pending or self._pending_edits:
+            print(f"⚠️ Не отправлено админу при остановке: {self.queue_size()}")
+
+
+# --- Проверка без Telegram ---
+
+class FakeBot:
+    """Имитация Bot: задержка API и лимит частоты с ответом RetryAfter."""
+
+    class _Message:
+        def __init__(self, message_id):
+            self.message_id = message_id
+
+    def __init__(self, latency: float = 0.05, flood_rate: float = RATE_PER_SECOND * 1.5, reject: str = None):
+        self.latency = latency
+        self.flood_rate = flood_rate
+        # Текст с этой подстрокой Telegram отклоняет (BadRequest) при любом parse_mode
+        self.reject = reject
+        self.calls = []
+        self.texts = {}
+        self._last_call = None
+
+    async def _call(self, method, text, parse_mode):
+        await asyncio.sleep(self.latency)
+        now = time.monotonic()
+        request = SendMessage(chat_id=0, text="") if method == "send_message" else EditMessageText(text="")
+        if self._last_call is not None and now - self._last_call < 1 / self.flood_rate:
+            raise TelegramRetryAfter(method=request, message="Flood control", retry_after=1)
+        # Как у Bot с ParseMode.HTML по умолчанию: голые < и & — ошибка разбора сущностей
+        if parse_mode == "HTML" and ("<" in text or "&" in text):
+            raise TelegramBadRequest(method=request, message="Bad Request: can't parse entities")
+        if self.reject and self.reject in text:
+            raise TelegramBadRequest(method=request, message="Bad Request: message is rejected")
+        self._last_call = now
+        self.calls.append(method)
+
+    async def send_message(self, chat_id, text, parse_mode="HTML"):
+        await self._call("send_message", text, parse_mode)
+        message_id = len(self.texts) + 1
+        self.texts[message_id] = text
+        return self._Message(message_id)
+
+    async def edit_message_text(self, text, chat_id, message_id, parse_mode="HTML"):
+        await self._call("edit_message_text", text, parse_mode)
+        self.texts[message_id] = text
+
+
+async def simulate(events: int, duration: float, edit_share: float, rate: float, burst: int):
+    """Поток событий как при всплеске в боте: отчеты об оценках и часть правок к ним."""
+    import random
+    bot = FakeBot()
+    notifier = AdminNotifier(chat_id=1, rate=rate, burst=burst)
+    notifier.start(bot)
+    keys = []
+    for i in range(events):
+        keys.append(notifier.send(f"🔔 user{i} оценивает:\n\"действие {i}\"\nОценка: {i % 10}"))
+        if keys and random.random() < edit_share:
+            notifier.edit(random.choice(keys[-20:]), f"✅ подтверждена оценка события {i}")
+        await asyncio.sleep(duration / events)
+    await notifier.close(timeout=60)
+    return notifier.stats, bot
+
+
+async def self_check():
+    """Автоматическая проверка на FakeBot: пользовательский текст с < и & не теряет отчеты.
+
+    Возвращает список проваленных проверок (пустой — все хорошо).
+    """
+    failures = []
+
+    def check(condition, name):
+        if not condition:
+            failures.append(name)
+
+    # 1. Одиночный отчет и его правка с символами HTML
+    bot = FakeBot(latency=0, flood_rate=1e6)
+    notifier = AdminNotifier(chat_id=1, rate=1000, burst=10)
+    notifier.start(bot)
+    raw = '🔔 @user оценивает:\n"a < b && <script>"\nОценка: 3.5'
+    key = notifier.send(raw)
+    await notifier.close(timeout=2)
+    check(list(bot.texts.values()) == [raw], "отчет с < и & доставлен без изменений")
+    notifier.start(bot)
+    notifier.edit(key, '✅ исправлено: "x <= y & z"')
+    await notifier.close(timeout=2)
+    check(bot.texts.get(1) == '✅ исправлено: "x <= y & z"', "правка с < и & применена")
+    check(notifier.stats["errors"] == 0, "нет ошибок API")
+
+    # 2. Дайджест, одно событие которого Telegram отклоняет: остальные доходят по одному
+    bot = FakeBot(latency=0, flood_rate=1e6, reject="BROKEN")
+    notifier = AdminNotifier(chat_id=1, rate=1000, burst=1)
+    for i in range(5):
+        notifier.send(f"событие {i} <{i}>" + (" BROKEN" if i == 2 else ""))
+    notifier.start(bot)
+    await notifier.close(timeout=2)
+    delivered = DIGEST_SEPARATOR.join(bot.texts.values())
+    check(all(f"событие {i} <{i}>" in delivered for i in (0, 1, 3, 4)), "дайджест без отклоненного события доставлен")
+    check("BROKEN" not in delivered and notifier.stats["dropped"] == 1, "отклонено ровно одно событие")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Проверка очереди сообщений админу на имитации Bot")
+    parser.add_argument("--check", action="store_true",
+                        help="автоматическая проверка (экранирование, отклоненный дайджест), код выхода 1 при ошибке")
+    parser.add_argument("--events", type=int, default=300)
+    parser.add_argument("--duration", type=float, default=10.0, help="за сколько секунд приходят события")
+    parser.add_argument("--edit-share", type=float, default=0.5, help="доля событий, за которыми следует правка")
+    parser.add_argument("--rate", type=float, default=RATE_PER_SECOND)
+    parser.add_argument("--burst", type=int, default=BURST)
+    args = parser.parse_args()
+
+    if args.check:
+        failures = asyncio.run(self_check())
+        for name in failures:
+            print(f"❌ {name}")
+        print("✅ Проверка очереди админу пройдена" if not failures else f"❌ Провалено проверок: {len(failures)}")
+        raise SystemExit(1 if failures else 0)
+
+    stats, bot = asyncio.run(simulate(args.events, args.duration, args.edit_share, args.rate, args.burst))
+    print(f"📨 Событий: {stats['events']}, правок: {stats['edits']} (слито с отправкой: {stats['collapsed']})")
+    print(f"📤 Вызовов API: {len(bot.calls)} — сообщений {stats['messages']} (дайджестов {stats['digests']}), "
+          f"правок {stats['api_edits']}")
+    print(f"⚠️ RetryAfter: {stats['retry_after']}, ошибок: {stats['errors']}, выброшено: {stats['dropped']}")
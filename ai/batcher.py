@@ -0,0 +1,104 @@
+import asyncio
+
+
+class InferenceBatcher:
+    """Микро-батчинг запросов к XPAnalyst.
+
+    Одновременные запросы копятся до max_batch_size текстов или max_delay_ms
+    миллисекунд, после чего весь батч уходит в нейросеть одним проходом,
+    а каждый вызывающий получает свой словарь с результатом.
+    """
+
+    def __init__(self, analyst, max_batch_size: int = 32, max_delay_ms: float = 10):
+        self.analyst = analyst
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_delay = max(0.0, max_delay_ms) / 1000
+        self._queue = None
+        self._worker = None
+        self._inflight = set()
+        # Тексты, уже взятые из очереди, но еще не отданные в инференс
+        self._collecting = []
+
+    def queue_size(self):
+        """Тексты, ждущие сборки в батч (для метрик)."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, text: str):
+        """Ставит текст в очередь и ждет результат анализа."""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    def _ensure_worker(self):
+        # Очередь и воркер создаются внутри работающего event loop. При
+        # перезапуске воркера очередь остается прежней: уже стоящие в ней
+        # тексты не теряются
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = self._collecting = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+
+            # Добираем батч, пока не кончилось окно ожидания или место
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Батч обрабатывается отдельной задачей, чтобы сборка следующего
+            # не ждала окончания инференса текущего
+            self._collecting = []
+            task = asyncio.create_task(self._process(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _process(self, batch):
+        texts = [text for text, _ in batch]
+        try:
+            results = await self.analyst.aanalyze_batch(texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            # Вызывающий мог уже отменить ожидание
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self):
+        """Останавливает фоновый воркер и дообрабатывает все принятые тексты.
+
+        Тексты из недособранного батча и из очереди считаются напрямую, так
+        что ни один вызывающий submit() не остается ждать до своего таймаута.
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        leftovers, self._collecting = self._collecting, []
+        while self._queue is not None and not self._queue.empty():
+            leftovers.append(self._queue.get_nowait())
+        for start in range(0, len(leftovers), self.max_batch_size):
+            await self._process(leftovers[start:start + self.max_batch_size])
+
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
@@ -0,0 +1,436 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from ai.predictor import (
+    XPAnalyst, KerasBackend, NumpyBackend, BACKENDS, MODEL_PATH, NUMPY_MODEL_PATH, VOCAB_PATH, MAX_LEN,
+)
+from ai.batcher import InferenceBatcher
+from ai.training_data import DATASET_DIR, iter_chunks, file_hash
+
+# Реальные фразы для набора замеров (suite)
+SAMPLE_PATH = os.path.join(DATASET_DIR, 'new_dataset.csv')
+SAMPLE_SIZE = 2000
+SEED = 42
+BATCH_SIZES = [1, 8, 32, 128]
+# Одновременных запросов через InferenceBatcher (как в боте)
+CONCURRENCY = 64
+# Допустимое ухудшение метрики в compare, %
+REGRESSION_PERCENT = 10
+
+# Метрики результатов: путь в JSON и что считается улучшением
+COMPARE_METRICS = [
+    (("cold_start_s",), "lower"),
+    (("single", "p50_ms"), "lower"),
+    (("single", "p99_ms"), "lower"),
+    (("concurrent", "texts_per_s"), "higher"),
+    (("concurrent", "p99_ms"), "lower"),
+    (("rss_mb", "peak"), "lower"),
+]
+
+# Фразы для замеров
+PHRASES = [
+    "помыл пол",
+    "сделал зарядку",
+    "спроектировал спорткар",
+    "приготовил завтрак",
+    "подготовил доклад по искусственному интеллекту",
+    "отремонтировал старый велосипед своими руками",
+    "выучил двадцать новых слов на испанском",
+    "собрал компьютер из комплектующих",
+]
+
+
+def percentile(values, p):
+    """Перцентиль без numpy (ближайший ранг)."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def measure_latency(analyst, runs, warmup=10):
+    """Латентность одиночных запросов analyze в миллисекундах."""
+    for i in range(warmup):
+        analyst.analyze(PHRASES[i % len(PHRASES)])
+
+    latencies = []
+    for i in range(runs):
+        start = time.perf_counter()
+        analyst.analyze(PHRASES[i % len(PHRASES)])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def compare_inference_paths(analyst, runs):
+    """Сравнение model.predict и скомпилированного tf.function пути."""
+    results = {}
+    for name, compiled in (("model.predict", False), ("tf.function", True)):
+        analyst.backend.compiled = compiled
+        latencies = measure_latency(analyst, runs)
+        results[name] = {
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+        }
+    analyst.backend.compiled = True
+    return results
+
+
+def measure_backend(backend, batch, runs, warmup=3):
+    """Латентность backend.predict на готовом батче в миллисекундах."""
+    for _ in range(warmup):
+        backend.predict(batch)
+
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        backend.predict(batch)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def compare_backends(keras_path, numpy_path, batch_sizes, runs, vocab_size=10000):
+    """Сравнение Keras (tf.function) и NumPy бэкендов: паритет и латентность по размерам батча."""
+    backends = {"keras": KerasBackend(keras_path), "numpy": NumpyBackend(numpy_path)}
+    rng = np.random.default_rng(42)
+    max_len = backends["keras"].max_len or MAX_LEN
+
+    results = {}
+    for size in batch_sizes:
+        batch = rng.integers(0, vocab_size, size=(size, max_len), dtype=np.int32)
+        expected = backends["keras"].predict(batch)
+        actual = backends["numpy"].predict(batch)
+        results[size] = {"max_abs_diff": float(np.max(np.abs(expected - actual)))}
+
+        for name, backend in backends.items():
+            latencies = measure_backend(backend, batch, runs)
+            results[size][name] = {
+                "p50_ms": round(percentile(latencies, 50), 3),
+                "p99_ms": round(percentile(latencies, 99), 3),
+            }
+    return results
+
+
+# --- Набор замеров на реальных фразах (suite / run / compare) ---
+
+def sample_phrases(path=SAMPLE_PATH, size=SAMPLE_SIZE, seed=SEED):
+    """Reservoir-выборка очищенных фраз из датасета (одна и та же при одном seed)."""
+    rng = random.Random(seed)
+    sample, seen = [], 0
+    for texts, _ in iter_chunks(path):
+        for text in texts:
+            seen += 1
+            if len(sample) < size:
+                sample.append(text)
+            else:
+                j = rng.randrange(seen)
+                if j < size:
+                    sample[j] = text
+    return sample
+
+
+def rss_mb():
+    """Текущий и пиковый RSS процесса в МБ; None — не измерить на этой платформе.
+
+    Linux — /proc и getrusage, macOS — getrusage (ru_maxrss в байтах, а не КиБ),
+    Windows — только при установленном psutil. Замеры скорости от этого не зависят.
+    """
+    current = peak = None
+    if os.path.exists('/proc/self/statm'):
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak *= 1 if sys.platform == 'darwin' else 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        current = current if current is not None else info.rss
+        # На Windows пиковый рабочий набор есть только у psutil
+        peak = peak if peak is not None else getattr(info, 'peak_wset', None)
+
+    def to_mb(value):
+        return round(value / 2**20, 1) if value is not None else None
+
+    return {"current": to_mb(current), "peak": to_mb(peak)}
+
+
+def latency_stats(latencies):
+    return {
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p90_ms": round(percentile(latencies, 90), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+    }
+
+
+def measure_single(analyst, phrases, runs):
+    """Прогретая латентность одиночного analyze на разных фразах."""
+    for text in phrases[:20]:
+        analyst.analyze(text)
+    latencies = []
+    for i in range(runs):
+        start = time.perf_counter()
+        analyst.analyze(phrases[i % len(phrases)])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latency_stats(latencies)
+
+
+def measure_batches(analyst, phrases, batch_sizes, texts_per_size):
+    """Пропускная способность analyze_batch (текстов в секунду) по размерам батча."""
+    results = {}
+    for size in batch_sizes:
+        analyst.analyze_batch(phrases[:size])
+        batches = max(1, texts_per_size // size)
+        # Фраз может быть меньше size: считаются тексты, реально ушедшие в батч
+        texts = 0
+        start = time.perf_counter()
+        for i in range(batches):
+            offset = (i * size) % max(1, len(phrases) - size)
+            batch = phrases[offset:offset + size]
+            analyst.analyze_batch(batch)
+            texts += len(batch)
+        elapsed = time.perf_counter() - start
+        results[str(size)] = {"texts_per_s": round(texts / elapsed, 1),
+                              "batch_ms": round(elapsed / batches * 1000, 3),
+                              "texts_per_batch": round(texts / batches, 1)}
+    return results
+
+
+async def measure_concurrent(analyst, phrases, concurrency, total):
+    """Путь бота: одновременные запросы через InferenceBatcher и пул потоков."""
+    batcher = InferenceBatcher(analyst)
+    latencies = []
+
+    async def worker(offset):
+        for i in range(offset, total, concurrency):
+            start = time.perf_counter()
+            await batcher.submit(phrases[i % len(phrases)])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await batcher.submit(phrases[0])
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await batcher.close()
+    return {"texts_per_s": round(total / elapsed, 1), "concurrency": concurrency, **latency_stats(latencies)}
+
+
+def model_version(model_path, vocab_path):
+    """Что именно измерялось: хеши файлов модели и словаря."""
+    return {
+        "model_path": model_path,
+        "model_sha256": file_hash(model_path)[:16],
+        "vocab_sha256": file_hash(vocab_path)[:16],
+    }
+
+
+def run_backend(backend, model_path, vocab_path, phrases, runs, batch_sizes, concurrency):
+    """Все замеры одного бэкенда. Вызывается в отдельном процессе, чтобы холодный
+    старт и RSS не зависели от других бэкендов."""
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    # Кэш выключен, иначе повторяющиеся фразы не доходят до модели
+    analyst = XPAnalyst(model_path, vocab_path, backend=backend, cache_size=0)
+    cold_start = time.perf_counter() - start
+    if not analyst.is_ready:
+        raise RuntimeError(f"модель {backend} не загрузилась: {analyst.load_error}")
+    rss_loaded = rss_mb()
+
+    result = {
+        "backend": backend,
+        **model_version(analyst.model_path, vocab_path),
+        "cold_start_s": round(cold_start, 3),
+        "single": measure_single(analyst, phrases, runs),
+        "batch": measure_batches(analyst, phrases, batch_sizes, runs * 4),
+        "concurrent": asyncio.run(measure_concurrent(analyst, phrases, concurrency, runs * 4)),
+    }
+    result["rss_mb"] = {"before_load": rss_before["current"], "after_load": rss_loaded["current"],
+                        **rss_mb()}
+    analyst.close()
+    return result
+
+
+def run_suite(backends, model_paths, vocab_path, sample_path, sample_size, runs, batch_sizes, concurrency):
+    """Запускает run_backend для каждого бэкенда в чистом процессе и собирает общий отчет."""
+    report = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "sample": {"path": sample_path, "size": sample_size, "seed": SEED},
+        "runs": runs,
+        "backends": {},
+    }
+    for backend in backends:
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as tmp:
+            output = tmp.name
+        command = [sys.executable, "-m", "ai.benchmark", "run", "--backend", backend,
+                   "--vocab", vocab_path, "--sample", sample_path, "--sample-size", str(sample_size),
+                   "--runs", str(runs), "--concurrency", str(concurrency), "--output", output,
+                   "--batch-sizes", *map(str, batch_sizes)]
+        if model_paths.get(backend):
+            command += ["--model", model_paths[backend]]
+        print(f"⏱ Замеры бэкенда {backend}...")
+        try:
+            proc = subprocess.run(command, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                  capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"❌ {backend}: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+                continue
+            with open(output, 'r', encoding='utf-8') as f:
+                report["backends"][backend] = json.load(f)
+        finally:
+            os.remove(output)
+    return report
+
+
+def print_report(report):
+    for backend, result in report["backends"].items():
+        single, concurrent = result["single"], result["concurrent"]
+        print(f"\n🧠 {backend} ({result['model_sha256']})")
+        rss = {key: "н/д" if value is None else f"{value} МБ" for key, value in result['rss_mb'].items()}
+        print(f"  холодный старт: {result['cold_start_s']:.2f} с | RSS: {rss['after_load']} "
+              f"после загрузки, пик {rss['peak']}")
+        print(f"  одиночный запрос: p50 {single['p50_ms']:.3f} ms | p90 {single['p90_ms']:.3f} ms | "
+              f"p99 {single['p99_ms']:.3f} ms")
+        for size, stats in result["batch"].items():
+            print(f"  батч {size:>4}: {stats['texts_per_s']:>9.1f} текстов/с ({stats['batch_ms']:.3f} ms на батч, "
+                  f"в среднем {stats.get('texts_per_batch', size)} текстов)")
+        print(f"  {concurrent['concurrency']} одновременных через батчер: {concurrent['texts_per_s']:.1f} текстов/с, "
+              f"p99 {concurrent['p99_ms']:.3f} ms")
+
+
+def _metric(result, path):
+    for key in path:
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def compare_reports(base, new, threshold=REGRESSION_PERCENT):
+    """Сравнение двух отчетов suite. Возвращает список регрессий хуже threshold %."""
+    regressions = []
+    for backend in sorted(set(base["backends"]) & set(new["backends"])):
+        old_result, new_result = base["backends"][backend], new["backends"][backend]
+        print(f"\n🧠 {backend}: {old_result['model_sha256']} -> {new_result['model_sha256']}")
+        metrics = list(COMPARE_METRICS) + [
+            (("batch", size, "texts_per_s"), "higher") for size in new_result["batch"]]
+        for path, better in metrics:
+            old_value, new_value = _metric(old_result, path), _metric(new_result, path)
+            if not old_value or new_value is None:
+                continue
+            change = (new_value - old_value) / old_value * 100
+            worse = change > threshold if better == "lower" else change < -threshold
+            mark = "❌" if worse else "  "
+            print(f"{mark} {'.'.join(path):<28} {old_value:>10g} -> {new_value:<10g} ({change:+.1f}%)")
+            if worse:
+                regressions.append((backend, ".".join(path), change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк инференса XPAnalyst")
+    subparsers = parser.add_subparsers(dest="command")
+
+    paths = subparsers.add_parser("paths", help="model.predict против tf.function")
+    paths.add_argument("--model", default=None)
+    paths.add_argument("--vocab", default=VOCAB_PATH)
+    paths.add_argument("--runs", type=int, default=300)
+
+    backends = subparsers.add_parser("backends", help="Keras против NumPy по размерам батча")
+    backends.add_argument("--keras-model", default=MODEL_PATH)
+    backends.add_argument("--numpy-model", default=NUMPY_MODEL_PATH)
+    backends.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32, 256])
+    backends.add_argument("--runs", type=int, default=50)
+
+    suite = subparsers.add_parser("suite", help="Полный набор замеров на фразах датасета, отчет в JSON")
+    run = subparsers.add_parser("run", help="Замеры одного бэкенда (используется suite)")
+    for sub in (suite, run):
+        sub.add_argument("--vocab", default=VOCAB_PATH)
+        sub.add_argument("--sample", default=SAMPLE_PATH, help="CSV с фразами для замеров")
+        sub.add_argument("--sample-size", type=int, default=SAMPLE_SIZE)
+        sub.add_argument("--runs", type=int, default=500, help="одиночных запросов (батчей и конкурентных — x4)")
+        sub.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+        sub.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    suite.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    suite.add_argument("--keras-model", default=None)
+    suite.add_argument("--numpy-model", default=None)
+    suite.add_argument("--json", help="сохранить отчет (для compare)")
+    run.add_argument("--backend", default="keras", choices=list(BACKENDS))
+    run.add_argument("--model", default=None)
+    run.add_argument("--output", required=True)
+
+    compare = subparsers.add_parser("compare", help="Сравнить два отчета suite (код выхода 1 при регрессии)")
+    compare.add_argument("base")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=REGRESSION_PERCENT, help="допустимое ухудшение, %%")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        phrases = sample_phrases(args.sample, args.sample_size)
+        result = run_backend(args.backend, args.model, args.vocab, phrases, args.runs,
+                             args.batch_sizes, args.concurrency)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        return
+
+    if args.command == "suite":
+        model_paths = {"keras": args.keras_model, "numpy": args.numpy_model}
+        report = run_suite(args.backends, model_paths, args.vocab, args.sample, args.sample_size,
+                           args.runs, args.batch_sizes, args.concurrency)
+        print_report(report)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"\n📄 Отчет сохранен: {args.json}")
+        return
+
+    if args.command == "compare":
+        with open(args.base, 'r', encoding='utf-8') as f:
+            base = json.load(f)
+        with open(args.new, 'r', encoding='utf-8') as f:
+            new = json.load(f)
+        regressions = compare_reports(base, new, args.threshold)
+        if regressions:
+            print(f"\n❌ Регрессий хуже {args.threshold}%: {len(regressions)}")
+            sys.exit(1)
+        print("\n✅ Регрессий нет")
+        return
+
+    if args.command == "backends":
+        results = compare_backends(args.keras_model, args.numpy_model, args.batch_sizes, args.runs)
+        for size, stats in results.items():
+            print(f"batch {size:<4} max |Δ|: {stats['max_abs_diff']:.2e}")
+            for name in ("keras", "numpy"):
+                print(f"    {name:<6} p50: {stats[name]['p50_ms']:.3f} ms | p99: {stats[name]['p99_ms']:.3f} ms")
+        return
+
+    # Кэш выключен, иначе повторяющиеся фразы не доходят до модели
+    analyst = XPAnalyst(getattr(args, "model", None), getattr(args, "vocab", VOCAB_PATH), cache_size=0)
+    if not analyst.is_ready:
+        return
+
+    for name, stats in compare_inference_paths(analyst, getattr(args, "runs", 300)).items():
+        print(f"{name:<15} p50: {stats['p50_ms']:.3f} ms | p99: {stats['p99_ms']:.3f} ms")
+    analyst.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import threading
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """Ограниченный LRU-кэш предсказаний с счетчиками попаданий.
+
+    Потокобезопасен: к нему обращаются потоки пула инференса.
+    max_size=0 отключает кэш.
+    """
+
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max(0, max_size)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if not self.max_size:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Счетчики для подбора размера кэша."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+    def __len__(self):
+        return len(self._data)
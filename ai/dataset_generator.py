@@ -2,16 +2,40 @@ import random
 import csv
 import os
 import re
+import json
 import time
+import asyncio
 import pynvml
 from datetime import datetime
 from typing import Optional, Set
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+
+from ai.dedup import NearDuplicateIndex
+from ai.preprocessing import clean_text
+
+# Датасеты лежат в ai/dataset независимо от текущей папки запуска
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASET_DIR = os.path.join(BASE_DIR, 'dataset')
 
 # --- КОНФИГУРАЦИЯ ---
-BASE_URL="http://10.14.0.2:1234/v1"
-AI_API_KEY="lm-studio"
+# Адрес можно переопределить переменной окружения (например, на мок-сервер)
+BASE_URL = os.getenv("BASE_URL", "http://10.14.0.2:1234/v1")
+AI_API_KEY = os.getenv("AI_API_KEY", "lm-studio")
 client = OpenAI(base_url=BASE_URL, api_key=AI_API_KEY)
+async_client = AsyncOpenAI(base_url=BASE_URL, api_key=AI_API_KEY)
+
+# Повторы запросов к LLM: число попыток и базовая задержка backoff (сек)
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0
+
+# Сколько действий оценивать одним запросом к судье (1 — по одному)
+JUDGE_BATCH_SIZE = 8
+
+# Порог сходства (Жаккар по словам), выше которого фраза считается почти-дублем
+DEDUP_THRESHOLD = 0.7
+
+# Статистика запросов асинхронного конвейера
+USAGE = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "near_duplicates": 0}
 
 # Темы для обеспечения разнообразия датасета
 CATEGORIES = [
@@ -27,15 +51,15 @@ def final_clean(text: str) -> str:
     """Глубокая очистка текста от артефактов модели."""
     text = re.sub(r'\(.*?\)', '', text)
     text = re.sub(r'(сложность|параметры|значение|баллы|одобряемость)\s*\d*', '', text, flags=re.IGNORECASE)
-    # Удаляем всё кроме букв и пробелов
-    text = "".join(c for c in text if c.isalpha() or c.isspace())
-    return " ".join(text.split()).lower().strip()
+    # Цифры в ответах генератора — нумерация и оценки, а не часть действия
+    text = re.sub(r'\d+', '', text)
+    # Дальше — та же нормализация, что при обучении и в боте
+    return clean_text(text)
 
 
-def get_action(complexity: int) -> Optional[str]:
-    """Шаг 1: Генератор действия с принудительной сменой темы."""
-    category = random.choice(CATEGORIES)
-    prompt = f"""
+def action_prompt(complexity: int, category: str) -> str:
+    """Промпт генератора действия."""
+    return f"""
     Придумай одно уникальное действие в сфере быта или обучения.
     КАТЕГОРИЯ: {category}
     ЦЕЛЕВАЯ СЛОЖНОСТЬ: {complexity} из 10.
@@ -58,6 +82,12 @@ def get_action(complexity: int) -> Optional[str]:
     4. ЗАПРЕЩЕНО: посуда, стирка, фотографии, котята, часы (уже много в базе).
     5. Будь конкретным в терминах. Только текст действия!
     """
+
+
+def get_action(complexity: int) -> Optional[str]:
+    """Шаг 1: Генератор действия с принудительной сменой темы."""
+    category = random.choice(CATEGORIES)
+    prompt = action_prompt(complexity, category)
     try:
         res = client.chat.completions.create(
             model="local-model",
@@ -69,13 +99,8 @@ def get_action(complexity: int) -> Optional[str]:
         return None
 
 
-def evaluate_complexity(action: str) -> float:
-    """Шаг 2: ИИ-Судья оценивает реальную сложность фразы."""
-    prompt = f"""
-    Оцени сложность действия по шкале 0-10 (физический и умственный труд).
-    Действие: "{action}"
-
-    Критерии:
+# Шкала оценки для ИИ-судьи (общая для одиночной и пакетной оценки)
+JUDGE_CRITERIA = """
         0 - секундное действие не требующее каких-то усилий
         1 - рутинное действие, о котором даже не задумываемся
         2 - ежедневное базовое бытовое действие, не более пары минут для реализации
@@ -86,18 +111,77 @@ def evaluate_complexity(action: str) -> float:
         7 - средней сложности действие, требующее физических и интеллектуальных усилий, более двух часов работы
         8 - действие повышенной сложности, завязанное на комбинации интеллектуального и физического труда
         9 - действие повышенной сложности, завязанное на комбинации интеллектуального и физического труда, создание или реставрация чего-то уникального
-        10 - многонедельный интеллектуально и физически сложный процесс 
+        10 - многонедельный интеллектуально и физически сложный процесс """
+
+
+def judge_prompt(action: str) -> str:
+    """Промпт ИИ-судьи."""
+    return f"""
+    Оцени сложность действия по шкале 0-10 (физический и умственный труд).
+    Действие: "{action}"
+
+    Критерии:{JUDGE_CRITERIA}
 
     Верни ТОЛЬКО число (например 7.5).
     """
+
+
+def batch_judge_prompt(actions) -> str:
+    """Промпт ИИ-судьи для пакета действий: шкала передается один раз."""
+    numbered = "\n".join(f"    {i}. {action}" for i, action in enumerate(actions, start=1))
+    return f"""
+    Оцени сложность каждого действия по шкале 0-10 (физический и умственный труд).
+    Действия:
+{numbered}
+
+    Критерии:{JUDGE_CRITERIA}
+
+    Верни ТОЛЬКО JSON-массив из {len(actions)} чисел в том же порядке (например [7.5, 2, 4.5]).
+    """
+
+
+def parse_batch_scores(content: Optional[str], count: int) -> dict:
+    """Оценки пакета: {индекс действия: оценка}.
+
+    Понимает JSON-массив (принимается только при совпадении длины)
+    и нумерованный список вида "1. 7.5" / "1) 7.5".
+    """
+    if not content:
+        return {}
+
+    match = re.search(r'\[.*?\]', content, flags=re.DOTALL)
+    if match:
+        try:
+            values = json.loads(match.group(0))
+            if len(values) == count:
+                return {i: float(v) for i, v in enumerate(values)}
+        except (ValueError, TypeError):
+            pass
+
+    scores = {}
+    for number, value in re.findall(r'^\s*(\d+)\s*[.)\-:]\s*(\d+(?:\.\d+)?)\s*$', content, flags=re.MULTILINE):
+        index = int(number) - 1
+        if 0 <= index < count:
+            scores[index] = float(value)
+    return scores
+
+
+def parse_score(content: Optional[str]) -> float:
+    """Первое число из ответа судьи (5.0, если числа нет)."""
+    nums = re.findall(r'\d+\.\d+|\d+', content or "")
+    return float(nums[0]) if nums else 5.0
+
+
+def evaluate_complexity(action: str) -> float:
+    """Шаг 2: ИИ-Судья оценивает реальную сложность фразы."""
+    prompt = judge_prompt(action)
     try:
         res = client.chat.completions.create(
             model="local-model",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.0
         )
-        nums = re.findall(r'\d+\.\d+|\d+', res.choices[0].message.content)
-        return float(nums[0]) if nums else 5.0
+        return parse_score(res.choices[0].message.content)
     except:
         return 5.0
 
@@ -117,7 +201,7 @@ def load_existing_actions(filename: str) -> Set[str]:
     return actions
 
 
-def write_to_csv(action: str, c: float, filename: str = 'dataset/new_dataset.csv'):
+def write_to_csv(action: str, c: float, filename: str = os.path.join(DATASET_DIR, 'new_dataset.csv')):
     """Запись в CSV в папку 'dataset'."""
     file_exists = os.path.isfile(filename)
     with open(filename, mode='a', encoding='utf-16', newline='') as f:
@@ -138,13 +222,159 @@ def get_gpu_temp() -> int:
         print(f"Ошибка чтения температуры: {e}")
         return 0
 
+# --- АСИНХРОННЫЙ КОНВЕЙЕР ---
+
+async def _chat(prompt: str, temperature: float) -> Optional[str]:
+    """Запрос к LLM с повторами и экспоненциальным backoff (None, если все попытки неудачны)."""
+    for attempt in range(MAX_RETRIES):
+        try:
+            res = await async_client.chat.completions.create(
+                model="local-model",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature
+            )
+            USAGE["requests"] += 1
+            if res.usage:
+                USAGE["prompt_tokens"] += res.usage.prompt_tokens or 0
+                USAGE["completion_tokens"] += res.usage.completion_tokens or 0
+            return res.choices[0].message.content
+        except Exception as e:
+            if attempt == MAX_RETRIES - 1:
+                print(f"Запрос к LLM не удался после {MAX_RETRIES} попыток: {e}")
+                return None
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt + random.random() * RETRY_BACKOFF)
+
+
+async def aget_action(complexity: int) -> Optional[str]:
+    """Асинхронная версия get_action."""
+    content = await _chat(action_prompt(complexity, random.choice(CATEGORIES)), temperature=0.9)
+    return final_clean(content) if content else None
+
+
+async def aevaluate_complexity(action: str) -> float:
+    """Асинхронная версия evaluate_complexity."""
+    return parse_score(await _chat(judge_prompt(action), temperature=0.0))
+
+
+async def aevaluate_complexity_batch(actions) -> list:
+    """Оценка пакета действий одним запросом.
+
+    Действия, для которых судья не вернул оценку (или вернул не тот
+    размер массива), оцениваются по одному.
+    """
+    if len(actions) == 1:
+        return [await aevaluate_complexity(actions[0])]
+
+    scores = parse_batch_scores(await _chat(batch_judge_prompt(actions), temperature=0.0), len(actions))
+    missing = [i for i in range(len(actions)) if i not in scores]
+    if missing:
+        fallback = await asyncio.gather(*(aevaluate_complexity(actions[i]) for i in missing))
+        scores.update(zip(missing, fallback))
+    return [scores[i] for i in range(len(actions))]
+
+
+async def wait_for_gpu_cooldown():
+    """Пауза конвейера при перегреве GPU (pynvml вызывается в отдельном потоке)."""
+    current_temp = await asyncio.to_thread(get_gpu_temp)
+    if current_temp > 78:  # Если карта горячее 78 градусов
+        print(f"--- GPU ПЕРЕГРЕТА ({current_temp}°C). Ждем охлаждения... ---")
+        while await asyncio.to_thread(get_gpu_temp) > 60:  # Ждем, пока остынет до 60
+            await asyncio.sleep(5)
+        print("--- Температура в норме, продолжаем работу. ---")
+
+
+def complexity_targets(min_c: int, max_c: int, random_complexity: bool):
+    """Бесконечная последовательность целевых сложностей (как в последовательном режиме)."""
+    target_c = 0
+    while True:
+        if random_complexity:
+            target_c = random.randint(min_c, max_c)
+        elif target_c == 10:
+            target_c = 0
+        else:
+            target_c += 1
+        yield target_c
+
+
+async def generate_dataset(path: str, total: int, min_c: int, max_c: int,
+                           random_complexity: bool, concurrency: int = 8,
+                           judge_batch: int = JUDGE_BATCH_SIZE,
+                           dedup_threshold: float = DEDUP_THRESHOLD) -> NearDuplicateIndex:
+    """Конвейер генерации: генераторы -> судьи -> один писатель CSV.
+
+    В каждой стадии до concurrency запросов к LLM одновременно. Судья
+    оценивает до judge_batch действий одним запросом. Проверка
+    уникальности и запись идут в одном потоке event loop, поэтому дубли
+    не проходят, а строки пишутся по одной через единственного писателя.
+
+    Почти-дубли (сходство >= dedup_threshold) отсекаются индексом MinHash,
+    который сохраняется рядом с датасетом и дочитывает только новые строки.
+    """
+    seen_actions = NearDuplicateIndex.for_dataset(path, dedup_threshold)
+    print(f"Уже известно фраз: {len(seen_actions)}")
+
+    targets = complexity_targets(min_c, max_c, random_complexity)
+    to_judge = asyncio.Queue(maxsize=concurrency * max(1, judge_batch) * 2)
+    to_write = asyncio.Queue()
+    reserved = 0  # Принятые фразы (уже прошли проверку уникальности)
+
+    async def generator():
+        nonlocal reserved
+        while reserved < total:
+            target_c = next(targets)
+            await wait_for_gpu_cooldown()
+            action = await aget_action(target_c)
+            # Проверка на длину и уникальность (без await между проверкой и добавлением)
+            if reserved < total and action and len(action.split()) >= 3:
+                if not seen_actions.add_if_new(action):
+                    USAGE["near_duplicates"] += 1
+                    continue
+                reserved += 1
+                await to_judge.put((action, target_c))
+
+    async def judge():
+        while True:
+            # Берем то, что уже накопилось в очереди, но не больше judge_batch
+            batch = [await to_judge.get()]
+            while len(batch) < judge_batch and not to_judge.empty():
+                batch.append(to_judge.get_nowait())
+
+            scores = await aevaluate_complexity_batch([action for action, _ in batch])
+            for (action, target_c), real_c in zip(batch, scores):
+                # Среднее арифметическое для сглаживания данных
+                await to_write.put((action, (real_c + target_c) / 2))
+
+    async def writer():
+        file_exists = os.path.isfile(path)
+        with open(path, mode='a', encoding='utf-16', newline='') as f:
+            csv_writer = csv.writer(f, delimiter=';')
+            if not file_exists:
+                csv_writer.writerow(['text', 'complexity'])
+            for new_count in range(1, total + 1):
+                action, final_score = await to_write.get()
+                csv_writer.writerow([action, round(final_score, 2)])
+                f.flush()
+                print(f"[{new_count}/{total}] | {datetime.now().strftime('%H:%M:%S')} | {action} | C:{final_score:.1f}")
+
+    judges = [asyncio.create_task(judge()) for _ in range(concurrency)]
+    writer_task = asyncio.create_task(writer())
+    await asyncio.gather(*(generator() for _ in range(concurrency)))
+    await writer_task
+    for task in judges:
+        task.cancel()
+
+    # Новые строки уже в индексе, sync только сдвигает смещение в CSV
+    seen_actions.sync(path)
+    seen_actions.save(f"{path}.dedup.npz")
+    return seen_actions
+
+
 if __name__ == "__main__":
     # Создаем папку, если её нет
-    if not os.path.exists('dataset'):
-        os.makedirs('dataset')
+    if not os.path.exists(DATASET_DIR):
+        os.makedirs(DATASET_DIR)
 
-    DATASET_PATH = os.path.join('dataset', input("Введите название файла датасета:"))
-    seen_actions = load_existing_actions(DATASET_PATH)
+    DATASET_PATH = os.path.join(DATASET_DIR, input("Введите название файла датасета:"))
 
     # --- НАСТРОЙКИ ЗАПУСКА ---
     MIN_RANDOM = int(input("Минимальный порог шкалы:"))
@@ -156,45 +386,19 @@ if __name__ == "__main__":
         f"0 - сложность действий будет возрастать на 1\n"
         f"Ваш ответ:"
     ))
-    PAUSE_INTERVAL = 0  # Через сколько строк делать паузу
-    PAUSE_TIME = 0  # Длительность паузы в секундах
+    CONCURRENCY = int(input("Параллельных запросов к LLM (по умолчанию 8):") or 8)
+    JUDGE_BATCH = int(input(f"Действий в одном запросе к судье (по умолчанию {JUDGE_BATCH_SIZE}):") or JUDGE_BATCH_SIZE)
 
-
-    new_count = 0
-    target_c = 0
+    started = time.time()
     print(f"[{datetime.now().strftime('%H:%M:%S')}] Скрипт запущен.")
-    print(f"Уже известно фраз: {len(seen_actions)}")
 
-    while new_count < TOTAL_RECORDS:
-        if RANDOM_COMPLEXITY == 1: target_c =  random.randint(MIN_RANDOM, MAX_RANDOM)
-        elif target_c == 10:
-            target_c = 0
-        else:
-            target_c += 1
-        action = get_action(target_c)
-
-        current_temp = get_gpu_temp()
-        if current_temp > 78:  # Если карта горячее 78 градусов
-            print(f"--- GPU ПЕРЕГРЕТА ({current_temp}°C). Ждем охлаждения... ---")
-            while get_gpu_temp() > 60:  # Ждем, пока остынет до 60
-                time.sleep(5)
-            print("--- Температура в норме, продолжаем работу. ---")
-
-        # Проверка на длину и уникальность
-        if action and len(action.split()) >= 3 and action not in seen_actions:
-            real_c = evaluate_complexity(action)
-
-            # Среднее арифметическое для сглаживания данных
-            final_score = (real_c + target_c) / 2
-
-            write_to_csv(action, final_score, DATASET_PATH)
-            seen_actions.add(action)
-            new_count += 1
-
-            print(
-                f"[{new_count}/{TOTAL_RECORDS}] | {get_gpu_temp()}°C | {datetime.now().strftime('%H:%M:%S')} | {action} | C:{final_score:.1f}")
-        else:
-            continue
+    seen_actions = asyncio.run(generate_dataset(
+        DATASET_PATH, TOTAL_RECORDS, MIN_RANDOM, MAX_RANDOM, RANDOM_COMPLEXITY == 1, CONCURRENCY, JUDGE_BATCH
+    ))
 
+    elapsed_min = max(time.time() - started, 1e-6) / 60
     print(f"--- ГЕНЕРАЦИЯ ЗАВЕРШЕНА ---")
-    print(f"Итого в базе {len(seen_actions)} уникальных записей.")
\ No newline at end of file
+    print(f"Итого в базе {len(seen_actions)} уникальных записей. Скорость: {TOTAL_RECORDS / elapsed_min:.1f} записей/мин")
+    print(f"Запросов к LLM: {USAGE['requests']} | "
+          f"prompt-токенов на запись: {USAGE['prompt_tokens'] / max(TOTAL_RECORDS, 1):.0f} | "
+          f"отброшено почти-дублей: {USAGE['near_duplicates']}")
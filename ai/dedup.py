@@ -0,0 +1,284 @@
+import io
+import os
+import csv
+import json
+import hashlib
+import argparse
+
+import numpy as np
+
+# Параметры MinHash/LSH по умолчанию
+NUM_PERM = 64
+THRESHOLD = 0.7
+NGRAM = 1
+SEED = 42
+
+# Простое число < 2^32: (a * x + b) % PRIME не переполняет uint64
+_PRIME = np.uint64(4294967291)
+
+# Сколько байт начала CSV хешируется, чтобы заметить подмену файла
+_HEAD_BYTES = 4096
+
+
+def shingles(text: str, ngram: int = NGRAM) -> set:
+    """Словесные n-граммы (от 1 до ngram слов) очищенной фразы."""
+    words = text.lower().split()
+    result = set()
+    for n in range(1, ngram + 1):
+        for i in range(len(words) - n + 1):
+            result.add(" ".join(words[i:i + n]))
+    return result
+
+
+def _stable_hash(shingle: str) -> int:
+    # hash() в Python солится на каждый запуск, а индекс хранится на диске
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=4).digest(), 'little')
+
+
+def lsh_params(threshold: float, num_perm: int):
+    """Число полос и строк в полосе, при которых порог LSH (1/b)^(1/r) ближе всего к threshold.
+
+    При равной близости выбирается более низкий порог — лишний кандидат
+    отсеется проверкой подписи, а пропущенный дубль уже не найти.
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        lsh_threshold = (1 / bands) ** (1 / rows)
+        score = (abs(lsh_threshold - threshold), lsh_threshold > threshold)
+        if best is None or score < best[0]:
+            best = (score, bands, rows)
+    return best[1], best[2]
+
+
+class NearDuplicateIndex:
+    """Индекс почти-дублей фраз датасета (MinHash + LSH).
+
+    Фраза считается дублем, если оценка сходства Жаккара ее словесных
+    n-грамм с какой-то фразой индекса >= threshold. Кандидаты ищутся по
+    корзинам LSH (сублинейно), затем проверяются по подписям.
+
+    Индекс хранится в .npz рядом с датасетом вместе с байтовым смещением
+    в CSV: при следующем запуске sync() дочитывает только новые строки.
+    """
+
+    def __init__(self, threshold: float = THRESHOLD, num_perm: int = NUM_PERM,
+                 ngram: int = NGRAM, seed: int = SEED):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.ngram = ngram
+        self.seed = seed
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, int(_PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, int(_PRIME), size=num_perm, dtype=np.uint64)
+
+        self.texts = []
+        self._text_ids = {}
+        self._signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self._pending = []  # Подписи, добавленные после последнего np.vstack
+        self._buckets = [{} for _ in range(self.bands)]
+
+        # Откуда дочитывать исходный CSV и хеш его начала (чтобы заметить подмену)
+        self.source_offset = 0
+        self.source_head = ""
+        self.source_head_len = 0
+
+    # --- MinHash ---
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.array([_stable_hash(s) for s in shingles(text, self.ngram)], dtype=np.uint64)
+        if hashes.size == 0:
+            return np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+        hashes %= _PRIME
+        # (num_perm, n_shingles) -> минимум по каждой перестановке
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def _signature_at(self, idx):
+        stored = len(self._signatures)
+        return self._signatures[idx] if idx < stored else self._pending[idx - stored]
+
+    # --- Поиск и добавление ---
+
+    def query(self, text: str, signature=None):
+        """(индекс, сходство) самой похожей фразы выше порога или None."""
+        if text in self._text_ids:
+            return self._text_ids[text], 1.0
+        signature = self.signature(text) if signature is None else signature
+
+        candidates = set()
+        for band, key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(key, ()))
+
+        best = None
+        for idx in candidates:
+            similarity = float(np.mean(self._signature_at(idx) == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (idx, similarity)
+        return best
+
+    def is_duplicate(self, text: str) -> bool:
+        return self.query(text) is not None
+
+    def add(self, text: str, signature=None) -> bool:
+        """Добавляет фразу в индекс (False, если точно такая уже есть)."""
+        if text in self._text_ids:
+            return False
+        signature = self.signature(text) if signature is None else signature
+        idx = len(self.texts)
+        self.texts.append(text)
+        self._text_ids[text] = idx
+        self._pending.append(signature)
+        for band, key in self._band_keys(signature):
+            self._buckets[band].setdefault(key, []).append(idx)
+        return True
+
+    def add_if_new(self, text: str) -> bool:
+        """Атомарная (для event loop) проверка на почти-дубль и добавление."""
+        signature = self.signature(text)
+        if self.query(text, signature) is not None:
+            return False
+        return self.add(text, signature)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __contains__(self, text):
+        return text in self._text_ids
+
+    # --- Синхронизация с CSV датасета ---
+
+    @staticmethod
+    def _head_hash(path, length):
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read(length)).hexdigest()
+
+    def sync(self, csv_path: str) -> int:
+        """Дочитывает новые строки CSV (UTF-16, ';') с сохраненного смещения.
+
+        Если файл подменили или укоротили, индекс перестраивается с нуля.
+        Незавершенная последняя строка не читается до следующего вызова.
+        """
+        if not os.path.exists(csv_path):
+            return 0
+        size = os.path.getsize(csv_path)
+        if self.source_offset and (size < self.source_offset or
+                                   self._head_hash(csv_path, self.source_head_len) != self.source_head):
+            print(f"Датасет {csv_path} изменился, индекс дублей перестраивается.")
+            self.__init__(self.threshold, self.num_perm, self.ngram, self.seed)
+
+        with open(csv_path, 'rb') as f:
+            f.seek(self.source_offset)
+            raw = f.read()
+        if not raw:
+            return 0
+
+        start = 0
+        if self.source_offset == 0:
+            # Датасеты пишутся в utf-16 Python: BOM в начале, дальше little-endian
+            if raw[:2] != b'\xff\xfe':
+                raise ValueError(f"{csv_path}: ожидается CSV в UTF-16 LE с BOM")
+            start = 2
+        text = raw[start:].decode('utf-16-le', errors='ignore')
+        complete = text[:text.rfind('\n') + 1]
+        if not complete:
+            return 0
+
+        added = 0
+        reader = csv.reader(io.StringIO(complete, newline=''), delimiter=';')
+        if self.source_offset == 0:
+            next(reader, None)  # Пропуск заголовка
+        for row in reader:
+            if row and self.add(row[0].strip().lower()):
+                added += 1
+
+        self.source_offset += start + len(complete.encode('utf-16-le'))
+        self.source_head_len = min(self.source_offset, _HEAD_BYTES)
+        self.source_head = self._head_hash(csv_path, self.source_head_len)
+        return added
+
+    # --- Хранение ---
+
+    def save(self, path: str):
+        if self._pending:
+            self._signatures = np.vstack([self._signatures, np.array(self._pending, dtype=np.uint32)])
+            self._pending = []
+        meta = {
+            "threshold": self.threshold, "num_perm": self.num_perm, "ngram": self.ngram, "seed": self.seed,
+            "source_offset": self.source_offset, "source_head": self.source_head,
+            "source_head_len": self.source_head_len,
+        }
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, signatures=self._signatures,
+                 texts=np.frombuffer("\n".join(self.texts).encode('utf-8'), dtype=np.uint8),
+                 meta=json.dumps(meta))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, threshold: float = None):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            index = cls(meta["threshold"] if threshold is None else threshold,
+                        meta["num_perm"], meta["ngram"], meta["seed"])
+            signatures = data["signatures"]
+            texts = data["texts"].tobytes().decode('utf-8').split("\n") if len(signatures) else []
+
+        index.texts = texts
+        index._text_ids = {text: idx for idx, text in enumerate(texts)}
+        index._signatures = signatures
+        for idx, signature in enumerate(signatures):
+            for band, key in index._band_keys(signature):
+                index._buckets[band].setdefault(key, []).append(idx)
+        index.source_offset = meta["source_offset"]
+        index.source_head = meta["source_head"]
+        index.source_head_len = meta["source_head_len"]
+        return index
+
+    @classmethod
+    def for_dataset(cls, csv_path: str, threshold: float = THRESHOLD, ngram: int = NGRAM):
+        """Индекс датасета: загрузка сохраненного {csv_path}.dedup.npz и дочитывание новых строк."""
+        index_path = f"{csv_path}.dedup.npz"
+        index = None
+        if os.path.exists(index_path):
+            try:
+                index = cls.load(index_path, threshold)
+                if index.ngram != ngram:
+                    index = None
+            except Exception as e:
+                print(f"Предупреждение: не удалось загрузить индекс дублей ({e}), строим заново.")
+        if index is None:
+            index = cls(threshold, ngram=ngram)
+        index.sync(csv_path)
+        return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Поиск почти-дублей в датасете")
+    parser.add_argument("dataset", help="путь к CSV датасету (UTF-16, ';')")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="порог сходства Жаккара")
+    parser.add_argument("--ngram", type=int, default=NGRAM, help="максимальная длина словесной n-граммы")
+    parser.add_argument("--report", type=int, default=0, help="показать N найденных пар почти-дублей")
+    args = parser.parse_args()
+
+    index = NearDuplicateIndex.for_dataset(args.dataset, args.threshold, args.ngram)
+    index.save(f"{args.dataset}.dedup.npz")
+    print(f"✅ В индексе {len(index)} фраз (полос LSH: {index.bands} x {index.rows})")
+
+    if args.report:
+        # Проверяем каждую фразу против уже просмотренных
+        probe = NearDuplicateIndex(args.threshold, index.num_perm, args.ngram, index.seed)
+        found = 0
+        for text in index.texts:
+            match = probe.query(text)
+            if match is not None:
+                found += 1
+                if found <= args.report:
+                    print(f"  {match[1]:.2f} | {probe.texts[match[0]]} ~ {text}")
+            probe.add(text)
+        print(f"Почти-дублей в датасете: {found}")
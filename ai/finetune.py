@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import shutil
+import random
+import argparse
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from dotenv import load_dotenv
+
+from ai.teacher import (MODELS_DIR, MODEL_PATH, NUMPY_MODEL_PATH, VOCAB_PATH,
+                        export_numpy_weights, verify_export)
+from ai.preprocessing import clean_texts, metadata_path, load_metadata, check_metadata, save_metadata
+from ai.training_data import DATASET_DIR, TRAIN_SOURCES, detect_encoding, iter_sources, is_validation
+from ai.vocabulary import Vocabulary
+
+# Обратная связь пользователей, которую подхватывает дообучение
+FEEDBACK_SOURCES = [
+    os.path.join(DATASET_DIR, 'good_user_dataset.csv'),
+    os.path.join(DATASET_DIR, 'bad_user_dataset.csv'),
+]
+# Где бот хранит обратную связь: csv (файлы выше) или sqlite (таблица feedback), как в config.py
+load_dotenv()
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "csv")
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join("logs", "bot.sqlite3"))
+# Сколько строк каждого файла обратной связи уже использовано
+STATE_PATH = os.path.join(MODELS_DIR, 'finetune_state.json')
+
+# Параметры дообучения
+EPOCHS = 3
+LEARNING_RATE = 1e-4
+BATCH_SIZE = 32
+# Строк базового датасета на одну новую строку (replay против забывания)
+REPLAY_RATIO = 4
+MIN_REPLAY = 256
+# Размер проверочной выборки базового датасета и допустимый рост MAE на ней
+EVAL_SIZE = 2000
+MAX_MAE_INCREASE = 0.05
+
+
+def load_state(path=STATE_PATH):
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {'offsets': {}, 'versions': []}
+
+
+def save_state(state, path=STATE_PATH):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_new_feedback(state, sources=None):
+    """Строки обратной связи, добавленные после прошлого дообучения.
+
+    Возвращает (тексты, метки, новые смещения). Если файл стал короче
+    (ротация/очистка), он читается с начала.
+    """
+    texts, labels, offsets = [], [], {}
+    for path in sources or FEEDBACK_SOURCES:
+        if not os.path.exists(path):
+            continue
+        df = pd.read_csv(path, sep=';', encoding=detect_encoding(path))
+        df.columns = df.columns.str.strip()
+        offset = state['offsets'].get(os.path.basename(path), 0)
+        if offset > len(df):
+            offset = 0
+        offsets[os.path.basename(path)] = len(df)
+
+        df = df.iloc[offset:].copy()
+        df['complexity'] = pd.to_numeric(df['complexity'], errors='coerce')
+        df = df.dropna(subset=['complexity', 'text'])
+        texts.extend(clean_texts(df['text'].astype(str).tolist()))
+        labels.extend(df['complexity'].astype('float32').tolist())
+    return texts, np.array(labels, dtype=np.float32), offsets
+
+
+def read_new_feedback_sqlite(state, db_path=SQLITE_PATH):
+    """Обратная связь из SQLite-хранилища бота (STORAGE_BACKEND=sqlite) после прошлого дообучения.
+
+    Смещение — последний использованный id таблицы feedback.
+    """
+    # storage.py лежит в корне проекта: дообучение запускается оттуда (python -m ai.finetune)
+    from storage import SQLiteStorage
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"STORAGE_BACKEND=sqlite, но базы {db_path} нет (SQLITE_PATH)")
+
+    key = f"sqlite:{os.path.basename(db_path)}"
+    last_id = state['offsets'].get(key, 0)
+    storage = SQLiteStorage(db_path)
+    try:
+        rows = storage.read_feedback(last_id)
+    finally:
+        storage.close()
+
+    rows = [row for row in rows if row[1] and row[2] is not None]
+    texts = clean_texts([text for _, text, _ in rows])
+    labels = np.array([complexity for _, _, complexity in rows], dtype=np.float32)
+    offsets = {key: rows[-1][0] if rows else last_id}
+    return texts, labels, offsets
+
+
+def sample_base(sources, train_size, eval_size, seed=42):
+    """Reservoir-выборка из базового датасета за один потоковый проход.
+
+    Строки обучения идут в replay, строки валидации — в проверку качества.
+    """
+    rng = random.Random(seed)
+    reservoirs = {False: [], True: []}
+    sizes = {False: train_size, True: eval_size}
+    seen = {False: 0, True: 0}
+    for texts, labels in iter_sources(sources):
+        for text, label in zip(texts, labels):
+            split = is_validation(text)
+            seen[split] += 1
+            reservoir = reservoirs[split]
+            if len(reservoir) < sizes[split]:
+                reservoir.append((text, float(label)))
+            else:
+                j = rng.randrange(seen[split])
+                if j < sizes[split]:
+                    reservoir[j] = (text, float(label))
+
+    def unpack(rows):
+        return [text for text, _ in rows], np.array([label for _, label in rows], dtype=np.float32)
+
+    return unpack(reservoirs[False]), unpack(reservoirs[True])
+
+
+def mae(model, padded, labels):
+    if not len(labels):
+        return float('nan')
+    predictions = model.predict(padded, verbose=0, batch_size=256).reshape(-1)
+    return float(np.mean(np.abs(predictions - labels)))
+
+
+def promote(src, dst):
+    """Атомарная замена рабочего файла модели (бот видит либо старую, либо новую версию)."""
+    tmp_path = f"{dst}.tmp{os.path.splitext(dst)[1]}"
+    shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+def finetune(epochs=EPOCHS, replay_ratio=REPLAY_RATIO, promote_model=True, force=False,
+             storage_backend=STORAGE_BACKEND, db_path=SQLITE_PATH):
+    """Дообучение текущей модели на новой обратной связи с replay базового датасета.
+
+    Обратная связь читается из того хранилища, в которое ее пишет бот.
+    """
+    state = load_state()
+    if storage_backend == 'sqlite':
+        texts, labels, offsets = read_new_feedback_sqlite(state, db_path)
+    elif storage_backend == 'csv':
+        texts, labels, offsets = read_new_feedback(state)
+    else:
+        raise ValueError(f"неизвестное хранилище '{storage_backend}' (csv, sqlite)")
+    if not len(texts):
+        print("Новой обратной связи нет, дообучение не требуется.")
+        return None
+    print(f"🆕 Новых строк обратной связи: {len(texts)}")
+
+    # Словарь не меняется: эмбеддинги модели привязаны к его id
+    vocabulary = Vocabulary.load(VOCAB_PATH)
+    model = tf.keras.models.load_model(MODEL_PATH, compile=False)
+    max_len = model.input_shape[1]
+    metadata = load_metadata(MODEL_PATH)
+    if metadata is not None:
+        check_metadata(metadata, vocabulary, max_len)
+    model.compile(optimizer=tf.keras.optimizers.Adam(LEARNING_RATE), loss='mse', metrics=['mae'])
+
+    base_sources = [path for path in TRAIN_SOURCES if path not in FEEDBACK_SOURCES]
+    replay_size = max(MIN_REPLAY, replay_ratio * len(texts))
+    (replay_texts, replay_labels), (eval_texts, eval_labels) = sample_base(base_sources, replay_size, EVAL_SIZE)
+
+    new_padded = vocabulary.texts_to_padded(texts, max_len)
+    eval_padded = vocabulary.texts_to_padded(eval_texts, max_len)
+    before = {'feedback': mae(model, new_padded, labels), 'base': mae(model, eval_padded, eval_labels)}
+
+    train_padded = np.concatenate([new_padded, vocabulary.texts_to_padded(replay_texts, max_len)])
+    train_labels = np.concatenate([labels, replay_labels])
+    print(f"🚀 Дообучение: {len(texts)} новых + {len(replay_texts)} replay, эпох {epochs}")
+    model.fit(train_padded, train_labels, epochs=epochs, batch_size=BATCH_SIZE, shuffle=True, verbose=1)
+
+    after = {'feedback': mae(model, new_padded, labels), 'base': mae(model, eval_padded, eval_labels)}
+    print(f"🔍 MAE обратной связи: {before['feedback']:.4f} -> {after['feedback']:.4f} | "
+          f"MAE базовой валидации: {before['base']:.4f} -> {after['base']:.4f}")
+
+    # Версия сохраняется всегда, рабочим файлом становится только без деградации
+    version = time.strftime('%Y%m%d-%H%M%S')
+    version_base = os.path.join(MODELS_DIR, f"complexity_model.{version}")
+    model.save(f"{version_base}.keras")
+    export_numpy_weights(model, f"{version_base}.npz")
+    # Без базовой валидации экспорт сверяется на строках обратной связи
+    verify_export(model, f"{version_base}.npz", (eval_padded if len(eval_padded) else new_padded)[:500])
+    save_metadata(f"{version_base}.keras", vocabulary, max_len)
+
+    degraded = after['base'] - before['base'] > MAX_MAE_INCREASE
+    promoted = promote_model and (force or not degraded)
+    if promoted:
+        # Метаданные первыми: бот перечитывает модель по изменению её файла
+        promote(metadata_path(f"{version_base}.keras"), metadata_path(MODEL_PATH))
+        promote(f"{version_base}.keras", MODEL_PATH)
+        promote(f"{version_base}.npz", NUMPY_MODEL_PATH)
+        # Строки считаются использованными, только когда попали в рабочую модель
+        state['offsets'].update(offsets)
+        print(f"📦 Рабочая модель обновлена до версии {version}")
+    elif degraded:
+        print(f"⚠️ MAE на базовой выборке выросла больше чем на {MAX_MAE_INCREASE}, "
+              f"рабочая модель не заменена (версия {version_base}.keras сохранена, --force для замены).")
+
+    state['versions'].append({
+        'version': version, 'rows': len(texts), 'replay': len(replay_texts),
+        'before': before, 'after': after, 'promoted': promoted,
+    })
+    save_state(state)
+    return f"{version_base}.keras"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Дообучение модели на новой обратной связи пользователей")
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--replay-ratio", type=int, default=REPLAY_RATIO,
+                        help="строк базового датасета на одну строку обратной связи")
+    parser.add_argument("--no-promote", action="store_true",
+                        help="только сохранить версию, не заменяя рабочую модель")
+    parser.add_argument("--force", action="store_true",
+                        help="заменить рабочую модель даже при росте MAE на базовой выборке")
+    parser.add_argument("--storage", default=STORAGE_BACKEND, choices=["csv", "sqlite"],
+                        help="откуда читать обратную связь (по умолчанию STORAGE_BACKEND бота)")
+    parser.add_argument("--db", default=SQLITE_PATH, help="база SQLite при --storage sqlite")
+    args = parser.parse_args()
+
+    try:
+        finetune(args.epochs, args.replay_ratio, not args.no_promote, args.force, args.storage, args.db)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
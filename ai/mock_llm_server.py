@@ -0,0 +1,74 @@
+import re
+import json
+import random
+import asyncio
+import argparse
+
+from aiohttp import web
+
+# Словарь для фраз мок-генератора
+VERBS = ["собрал", "починил", "изучил", "настроил", "спроектировал", "приготовил", "посадил", "рассчитал"]
+OBJECTS = ["солнечный контроллер", "капельный полив", "бюджет семьи", "домашний сервер",
+           "ферментированный соус", "книжный стеллаж", "курс статистики", "теплицу из поликарбоната"]
+DETAILS = ["по чертежам", "с нуля", "за выходные", "для соседей", "по новой методике", "без инструкции"]
+
+
+def _fake_action():
+    # Случайное "слово" из букв, чтобы фразы были уникальными и после final_clean
+    suffix = "".join(random.choice("абвгдеклмнопрст") for _ in range(6))
+    return f"{random.choice(VERBS)} {random.choice(OBJECTS)} {random.choice(DETAILS)} {suffix}"
+
+
+def _fake_reply(prompt):
+    """Ответ в зависимости от промпта: действие, одна оценка или JSON-массив оценок."""
+    if "Придумай" in prompt:
+        return _fake_action()
+    if "JSON" in prompt:
+        count = sum(1 for line in prompt.splitlines() if re.match(r'\s*\d+\. ', line))
+        return json.dumps([round(random.uniform(0, 10), 1) for _ in range(count)])
+    return f"{random.uniform(0, 10):.1f}"
+
+
+def create_app(latency: float = 0.2, error_rate: float = 0.0):
+    """OpenAI-совместимый /v1/chat/completions с искусственной задержкой и ошибками."""
+
+    async def chat_completions(request):
+        payload = await request.json()
+        await asyncio.sleep(latency)
+        if random.random() < error_rate:
+            return web.json_response({"error": {"message": "mock overload"}}, status=503)
+
+        prompt = payload["messages"][-1]["content"]
+        content = _fake_reply(prompt)
+        prompt_tokens = len(prompt.split())
+        completion_tokens = len(content.split())
+        return web.json_response({
+            "id": "mock",
+            "object": "chat.completion",
+            "created": 0,
+            "model": payload.get("model", "local-model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Мок OpenAI-совместимого сервера для dataset_generator")
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--latency", type=float, default=0.2, help="задержка ответа, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    args = parser.parse_args()
+
+    web.run_app(create_app(args.latency, args.error_rate), port=args.port)
@@ -0,0 +1,140 @@
+import io
+import json
+import re
+import zipfile
+
+import numpy as np
+
+
+def _sigmoid(x):
+    # sigmoid через tanh: одна векторная операция и без переполнения exp
+    return 0.5 * (np.tanh(0.5 * x) + 1.0)
+
+
+def _relu(x):
+    return np.maximum(x, 0.0)
+
+
+class NumpyComplexityModel:
+    """Forward pass модели сложности на чистом NumPy (без TensorFlow).
+
+    Повторяет архитектуру create_model() из teacher.py:
+    Embedding → Bidirectional(LSTM, return_sequences) → GlobalAveragePooling1D
+    → Dense(relu) → Dense(relu) → Dense(1). Dropout на инференсе не используется.
+
+    Оптимизации для батчей:
+    - Embedding и входная проекция LSTM свернуты в одну таблицу
+      (vocab, 8 * units): вместо матричного умножения на каждом шаге — gather;
+    - оба направления считаются одним batched matmul на шаг;
+    - скрытые состояния не сохраняются, а сразу суммируются для пулинга.
+    """
+
+    def __init__(self, weights):
+        weights = {name: np.asarray(value) for name, value in weights.items()}
+        self.max_len = int(weights.pop('max_len', 0)) or None
+        self.weights = weights
+
+        units = weights['forward_recurrent_kernel'].shape[0]
+        self.units = units
+
+        kernels, recurrents, biases = [], [], []
+        for prefix in ('forward', 'backward'):
+            kernels.append(self._reorder_gates(weights[f'{prefix}_kernel'], units))
+            recurrents.append(self._reorder_gates(weights[f'{prefix}_recurrent_kernel'], units))
+            biases.append(self._reorder_gates(weights[f'{prefix}_bias'], units))
+
+        embedding = weights['embedding'].astype(np.float32)
+        # (vocab, 8 * units): входной вклад обоих направлений для каждого слова
+        self._input_table = np.ascontiguousarray(
+            embedding @ np.concatenate(kernels, axis=1) + np.concatenate(biases),
+            dtype=np.float32,
+        )
+        # (2, units, 4 * units): рекуррентные веса направлений
+        self._recurrent = np.ascontiguousarray(np.stack(recurrents), dtype=np.float32)
+
+    @staticmethod
+    def _reorder_gates(matrix, units):
+        """Keras хранит гейты как [i, f, c, o]; переставляем в [i, f, o, c],
+        чтобы сигмоида применялась к одному непрерывному срезу."""
+        i, f, c, o = (matrix[..., k * units:(k + 1) * units] for k in range(4))
+        return np.concatenate([i, f, o, c], axis=-1)
+
+    @classmethod
+    def load(cls, path):
+        """Загрузка весов из .npz, созданного teacher.export_numpy_weights."""
+        with np.load(path) as data:
+            return cls({name: data[name] for name in data.files})
+
+    @classmethod
+    def from_keras_file(cls, path):
+        """Извлечение весов прямо из сохраненного .keras (zip + h5) без TensorFlow.
+
+        Требует h5py.
+        """
+        import h5py
+
+        with zipfile.ZipFile(path) as archive:
+            config = json.loads(archive.read('config.json'))
+            h5_bytes = archive.read('model.weights.h5')
+
+        weights = {}
+        with h5py.File(io.BytesIO(h5_bytes), 'r') as h5:
+            layers = h5['layers']
+            weights['embedding'] = layers['embedding/vars/0'][()]
+            for prefix in ('forward', 'backward'):
+                cell = layers[f'bidirectional/{prefix}_layer/cell/vars']
+                weights[f'{prefix}_kernel'] = cell['0'][()]
+                weights[f'{prefix}_recurrent_kernel'] = cell['1'][()]
+                weights[f'{prefix}_bias'] = cell['2'][()]
+
+            # dense, dense_1, dense_2 ... в порядке следования в модели
+            dense_names = sorted(
+                (name for name in layers if re.fullmatch(r'dense(_\d+)?', name)),
+                key=lambda name: int(name.split('_')[1]) if '_' in name else 0,
+            )
+            for index, name in enumerate(dense_names):
+                weights[f'dense{index}_kernel'] = layers[f'{name}/vars/0'][()]
+                weights[f'dense{index}_bias'] = layers[f'{name}/vars/1'][()]
+
+        input_shape = config.get('build_config', {}).get('input_shape') or [None, 0]
+        weights['max_len'] = np.int32(input_shape[-1] or 0)
+        return cls(weights)
+
+    def predict(self, padded):
+        """Предсказание для батча последовательностей формы (batch, max_len)."""
+        w = self.weights
+        pooled = self._bilstm_mean(np.asarray(padded, dtype=np.intp))
+
+        hidden = _relu(pooled @ w['dense0_kernel'] + w['dense0_bias'])
+        hidden = _relu(hidden @ w['dense1_kernel'] + w['dense1_bias'])
+        return hidden @ w['dense2_kernel'] + w['dense2_bias']
+
+    def _bilstm_mean(self, ids):
+        """BiLSTM + GlobalAveragePooling1D: среднее скрытых состояний [forward, backward]."""
+        units = self.units
+        batch, steps = ids.shape
+        gates = 4 * units
+
+        # (batch, steps, 8 * units) — вход всех шагов обоих направлений одним gather
+        projected = self._input_table[ids]
+
+        h = np.zeros((2, batch, units), dtype=np.float32)
+        c = np.zeros((2, batch, units), dtype=np.float32)
+        total = np.zeros((2, batch, units), dtype=np.float32)
+        z = np.empty((2, batch, gates), dtype=np.float32)
+
+        for t in range(steps):
+            # forward идет по шагу t, backward — по шагу steps - 1 - t
+            np.matmul(h, self._recurrent, out=z)
+            z[0] += projected[:, t, :gates]
+            z[1] += projected[:, steps - 1 - t, gates:]
+
+            ifo = _sigmoid(z[..., :3 * units])
+            g = np.tanh(z[..., 3 * units:])
+            c *= ifo[..., units:2 * units]
+            c += ifo[..., :units] * g
+            h = ifo[..., 2 * units:] * np.tanh(c)
+            total += h
+
+        total /= steps
+        return np.concatenate([total[0], total[1]], axis=-1)
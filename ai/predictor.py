@@ -1,52 +1,407 @@
 import os
-import tensorflow as tf
-import pickle
-from tensorflow.keras.preprocessing.sequence import pad_sequences
+import time
+import asyncio
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ai.vocabulary import Vocabulary, VOCAB_PATH
+from ai.cache import PredictionCache
+from ai.preprocessing import MAX_LEN, metadata_path, load_metadata, check_metadata
 
 # --- НАСТРОЙКИ ПУТЕЙ ---
 # Указываем путь к папке 'models' в директории текущего файла
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODELS_DIR = os.path.join(BASE_DIR, 'models')
-TOKENIZERS_DIR = os.path.join(BASE_DIR, 'tokenizers')
 
 MODEL_PATH = os.path.join(MODELS_DIR, 'complexity_model.keras')
-TOKENIZER_PATH = os.path.join(TOKENIZERS_DIR, 'tokenizer.pickle')
+NUMPY_MODEL_PATH = os.path.join(MODELS_DIR, 'complexity_model.npz')
+
+
+class KerasBackend:
+    """Инференс через TensorFlow по файлу .keras."""
+
+    def __init__(self, model_path, compiled=True):
+        import tensorflow as tf
+        self._tf = tf
+        # compiled=True — прямой вызов модели через tf.function вместо model.predict
+        self.compiled = compiled
+        self.model = tf.keras.models.load_model(model_path, compile=False)
+        # Длина входа, с которой обучалась модель (None — любая)
+        self.max_len = self.model.input_shape[1]
+        # Сигнатура фиксирована, поэтому трассировка происходит один раз
+        self._infer = tf.function(
+            lambda x: self.model(x, training=False),
+            input_signature=[tf.TensorSpec(shape=(None, self.max_len), dtype=tf.int32)],
+        )
+        # Прогрев: первое сообщение пользователя не платит за трассировку
+        self._infer(tf.zeros((1, self.max_len or MAX_LEN), dtype=tf.int32))
+
+    def predict(self, padded):
+        """Forward pass: tf.function без накладных расходов predict или классический model.predict."""
+        if self.compiled:
+            return self._infer(self._tf.constant(padded, dtype=self._tf.int32)).numpy()
+        return self.model.predict(padded, verbose=0, batch_size=len(padded))
+
+
+class NumpyBackend:
+    """Инференс на NumPy без импорта TensorFlow.
+
+    Веса берутся из .npz (экспорт teacher.py) или прямо из .keras (нужен h5py).
+    """
+
+    def __init__(self, model_path):
+        from ai.numpy_model import NumpyComplexityModel
+        if model_path.endswith('.keras'):
+            self.model = NumpyComplexityModel.from_keras_file(model_path)
+        else:
+            self.model = NumpyComplexityModel.load(model_path)
+        self.max_len = self.model.max_len
+
+    def predict(self, padded):
+        return self.model.predict(padded)
+
+
+# Бэкенд инференса: класс и путь к модели по умолчанию
+BACKENDS = {
+    'keras': (KerasBackend, MODEL_PATH),
+    'numpy': (NumpyBackend, NUMPY_MODEL_PATH),
+}
+
+
+class LoadedModel:
+    """Загруженная версия модели: бэкенд, словарь и версии их файлов.
+
+    Запросы берут ссылку на текущую версию один раз, поэтому замена
+    (hot reload) не влияет на уже начатые батчи.
+    """
+
+    def __init__(self, backend, vocabulary, max_len, version):
+        self.backend = backend
+        self.vocabulary = vocabulary
+        self.max_len = max_len
+        self.version = version
+        self.loaded_at = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
 
 
 class XPAnalyst:
-    def __init__(self, model_path=MODEL_PATH, tokenizer_path=TOKENIZER_PATH):
-        """Загрузка модели и токенизатора из папки models"""
+    def __init__(self, model_path=None, vocab_path=VOCAB_PATH,
+                 max_workers=1, max_pending=64, timeout=10.0, compiled=True, backend='keras',
+                 cache_size=4096, lazy=False):
+        """Загрузка модели и токенизатора из папки models.
+
+        lazy=True — модель не грузится в конструкторе: первую загрузку в фоне
+        запускает start_loading(), пока она идет, status == "loading".
+        """
+        # Пул для асинхронного инференса: TF-вычисления не блокируют event loop
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="xp-inference")
+        # Backpressure: не больше max_pending задач в пуле одновременно
+        self._slots = asyncio.Semaphore(max_pending)
+        # Сколько слотов занято сейчас (меняется только в потоке event loop)
+        self._inflight = 0
+        self.max_pending = max_pending
+        self.timeout = timeout
+        # Кэш повторяющихся действий: ключ — версия модели и очищенный текст
+        self.cache = PredictionCache(cache_size)
+        self.vocab_path = vocab_path
+        self.compiled = compiled
+        self.backend_name = backend
+
+        # Hot reload: текущая и предыдущая (для отката) версии
+        self._active = None
+        self._previous = None
+        self._reload_lock = asyncio.Lock()
+        self._watch_task = None
+        # Версия файлов на диске, которую не нужно загружать (ошибка загрузки или откат)
+        self._skip_version = None
+        self.model_path = model_path or BACKENDS.get(backend, (None, None))[1]
+
+        # Готовность: loading -> ready | failed; _load_done — первая загрузка завершена
+        self.is_ready = False
+        self.status = "loading"
+        self.load_error = None
+        self.load_seconds = None
+        self._load_done = asyncio.Event()
+        self._load_task = None
+        if not lazy:
+            self._load_initial()
+            self._load_done.set()
+
+    def _load_initial(self):
+        """Первая загрузка: ошибка не роняет бота, а переводит его в статус failed."""
+        started = time.perf_counter()
         try:
-            # Загружаем модель сложности
-            self.model = tf.keras.models.load_model(model_path, compile=False)
-            # Загружаем токенизатор
-            with open(tokenizer_path, 'rb') as f:
-                self.tokenizer = pickle.load(f)
-            self.is_ready = True
-            print("✅ Нейросеть анализа сложности готова!")
+            if self.backend_name not in BACKENDS:
+                raise ValueError(f"неизвестный бэкенд инференса '{self.backend_name}'")
+            self._active = self._load()
         except Exception as e:
             print(f"❌ Ошибка загрузки активов: {e}")
-            self.is_ready = False
+            self.status = "failed"
+            self.load_error = str(e)
+            # Те же файлы не перечитываются, пока их не заменят
+            if self.model_path:
+                self._skip_version = self._disk_version()
+            return False
+        self.load_seconds = time.perf_counter() - started
+        self.is_ready = True
+        self.status = "ready"
+        print(f"✅ Нейросеть анализа сложности готова за {self.load_seconds:.1f} с! (бэкенд: {self.backend_name})")
+        return True
+
+    def start_loading(self):
+        """Запускает первую загрузку фоновой задачей (для lazy=True).
+
+        TensorFlow импортируется и модель прогревается в отдельном потоке,
+        event loop в это время обслуживает остальные запросы.
+        """
+        if self._load_task is None and not self._load_done.is_set():
+            self._load_task = asyncio.create_task(self._aload_initial())
+        return self._load_task
+
+    async def _aload_initial(self):
+        try:
+            async with self._reload_lock:
+                if self._active is None:
+                    await asyncio.to_thread(self._load_initial)
+        finally:
+            self._load_done.set()
+
+    async def wait_ready(self, timeout=None):
+        """Ждет окончания первой загрузки не дольше timeout сек. True — модель готова."""
+        if not self._load_done.is_set():
+            try:
+                await asyncio.wait_for(self._load_done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.is_ready
+
+    @property
+    def backend(self):
+        return self._active.backend if self._active else None
+
+    @property
+    def vocabulary(self):
+        return self._active.vocabulary if self._active else None
+
+    def _disk_version(self):
+        # Метаданных может не быть у старых моделей — это не мешает отслеживанию
+        return (self._file_version(self.model_path), self._file_version(self.vocab_path),
+                self._file_version(metadata_path(self.model_path)) or ())
+
+    def _load(self):
+        """Загрузка и прогрев новой версии (вызывается вне event loop)."""
+        version = self._disk_version()
+        backend_cls = BACKENDS[self.backend_name][0]
+        # Загружаем модель сложности
+        if self.backend_name == 'keras':
+            backend = backend_cls(self.model_path, compiled=self.compiled)
+        else:
+            backend = backend_cls(self.model_path)
+        # Загружаем словарь (vocab.json вместо pickle keras Tokenizer)
+        vocabulary = Vocabulary.load(self.vocab_path)
+
+        # Параметры предобработки, с которыми обучалась модель: расхождение — отказ
+        metadata = load_metadata(self.model_path)
+        if metadata is not None:
+            check_metadata(metadata, vocabulary, backend.max_len)
+            max_len = metadata['max_len']
+        else:
+            max_len = backend.max_len or MAX_LEN
+            print(f"⚠️ Нет {metadata_path(self.model_path)}: согласованность не проверена, max_len={max_len}")
+
+        # Прогрев и проверка: битая модель не должна попасть в работу
+        check = backend.predict(vocabulary.texts_to_padded(["проверка модели"], max_len))
+        if not np.all(np.isfinite(check)):
+            raise ValueError("модель вернула нечисловой результат")
+        return LoadedModel(backend, vocabulary, max_len, version)
 
     def analyze(self, text: str):
         """Возвращает только сложность действия и рассчитанный XP"""
         if not self.is_ready:
             return None
+        return self.analyze_batch([text])[0]
+
+    def analyze_batch(self, texts):
+        """Анализ сразу нескольких текстов за один проход нейросети."""
+        if not self.is_ready:
+            return [None] * len(texts)
+        if not texts:
+            return []
+
+        # Весь батч считается одной версией модели, даже если ее заменят посреди работы
+        active = self._active
+
+        results = [None] * len(texts)
+        misses = []
+        for i, text in enumerate(texts):
+            cached = self.cache.get((active.version, text))
+            if cached is not None:
+                results[i] = dict(cached)
+            else:
+                misses.append(i)
+        if not misses:
+            return results
+
+        # Повторы внутри одного батча считаем один раз
+        unique = list(dict.fromkeys(texts[i] for i in misses))
+
+        # 1. Предобработка: все тексты токенизируются и паддятся одним массивом
+        padded = active.vocabulary.texts_to_padded(unique, active.max_len)
+
+        # 2. Один forward pass на весь батч (один выход — сложность)
+        predictions = active.backend.predict(padded)
+
+        computed = {}
+        for text, pred in zip(unique, predictions):
+            computed[text] = self._build_result(text, float(pred[0]))
+            self.cache.put((active.version, text), computed[text])
+        for i in misses:
+            results[i] = dict(computed[texts[i]])
+        return results
+
+    def predict_batch(self, texts):
+        """Сырые выходы модели для очищенных текстов: без округления и кэша (для оценки качества)."""
+        if not self.is_ready:
+            raise RuntimeError(f"модель не загружена: {self.load_error}")
+        active = self._active
+        if not texts:
+            return np.zeros(0, dtype=np.float32)
+        return active.backend.predict(active.vocabulary.texts_to_padded(texts, active.max_len)).reshape(-1)
+
+    @staticmethod
+    def _file_version(path):
+        """Версия файла: время изменения и размер."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
 
-        MAX_LEN = 20  # Должно совпадать с параметром при обучении
+    # --- Hot reload ---
 
-        # 1. Предобработка текста
-        sequence = self.tokenizer.texts_to_sequences([text])
-        padded = pad_sequences(sequence, maxlen=MAX_LEN)
+    async def areload(self, force=False):
+        """Загружает версию с диска в фоновом потоке и атомарно подменяет текущую.
 
-        # 2. Предсказание (теперь только один выход — сложность)
-        prediction = self.model.predict(padded, verbose=0)
+        Запросы продолжают обслуживаться старой версией, пока новая грузится
+        и прогревается. При ошибке загрузки остается старая версия, ошибка
+        пробрасывается. Возвращает False, если файлы не менялись.
+        """
+        async with self._reload_lock:
+            if not force and self._active and self._disk_version() == self._active.version:
+                return False
+            loaded = await asyncio.to_thread(self._load)
+            self._previous, self._active = self._active, loaded
+            self._skip_version = None
+            self.is_ready = True
+            self.status = "ready"
+            self.load_error = None
+            self._load_done.set()
+            # Записи старой версии недостижимы, освобождаем память сразу
+            self.cache.clear()
+            print(f"🔄 Модель перезагружена ({loaded.loaded_at})")
+            return True
+
+    async def arollback(self):
+        """Возврат к предыдущей загруженной версии (False, если ее нет)."""
+        async with self._reload_lock:
+            if self._previous is None:
+                return False
+            self._previous, self._active = self._active, self._previous
+            # Файлы на диске не трогаем, но и не подхватываем их снова до следующего изменения
+            self._skip_version = self._disk_version()
+            self.cache.clear()
+            print(f"↩️ Откат модели к версии от {self._active.loaded_at}")
+            return True
+
+    def model_info(self):
+        """Сведения о текущей и предыдущей версиях для админа."""
+        return {
+            "status": self.status,
+            "error": self.load_error,
+            "load_seconds": self.load_seconds,
+            "backend": self.backend_name,
+            "model_path": self.model_path,
+            "active": self._active.loaded_at if self._active else None,
+            "previous": self._previous.loaded_at if self._previous else None,
+            "on_disk_changed": bool(self._active) and self._disk_version() != self._active.version,
+        }
+
+    async def watch(self, interval=30.0):
+        """Следит за файлами модели и словаря и перезагружает их после изменения.
+
+        Загрузка начинается, когда версия файлов не менялась между двумя
+        проверками: недописанный файл не будет прочитан.
+        """
+        pending = None
+        while True:
+            await asyncio.sleep(interval)
+            version = self._disk_version()
+            if None in version or version == self._skip_version:
+                continue
+            if self._active and version == self._active.version:
+                pending = None
+                continue
+            if version != pending:
+                pending = version
+                continue
+            try:
+                await self.areload()
+            except Exception as e:
+                print(f"❌ Ошибка перезагрузки модели, работает прежняя версия: {e}")
+                self._skip_version = version
+            pending = None
+
+    def start_watching(self, interval=30.0):
+        """Запускает watch() фоновой задачей (interval <= 0 — не следить)."""
+        if interval > 0 and self.model_path and (self._watch_task is None or self._watch_task.done()):
+            self._watch_task = asyncio.create_task(self.watch(interval))
+
+    def pending(self):
+        """Батчи, занявшие слот пула инференса (в работе или в очереди потока)."""
+        return self._inflight
+
+    def _release_slot(self):
+        self._inflight -= 1
+        self._slots.release()
+
+    async def aanalyze(self, text: str):
+        """Асинхронная версия analyze: предсказание выполняется в пуле потоков."""
+        results = await self.aanalyze_batch([text])
+        return results[0]
+
+    async def aanalyze_batch(self, texts):
+        """Асинхронная версия analyze_batch.
+
+        Если пул перегружен или предсказание не уложилось в timeout,
+        выбрасывается asyncio.TimeoutError.
+        """
+        if not self.is_ready:
+            return [None] * len(texts)
+
+        loop = asyncio.get_running_loop()
+        await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        self._inflight += 1
+        try:
+            future = self._executor.submit(self.analyze_batch, list(texts))
+        except Exception:
+            self._release_slot()
+            raise
+        # Слот освобождается только когда поток действительно закончил работу,
+        # даже если вызывающий перестал ждать по таймауту
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release_slot))
+        return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
 
-        # Извлекаем значение сложности
-        # Если модель выдает одно значение, берем первый элемент
-        comp = float(prediction[0][0])
+    def close(self):
+        """Останавливает первую загрузку, слежение за файлами и пул инференса."""
+        for task in (self._load_task, self._watch_task):
+            if task is not None:
+                task.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
-        # 3. Расчет XP на основе сложности
+    def _build_result(self, text, comp):
+        """Формирует ответ: сложность, XP и статус."""
+        # Расчет XP на основе сложности
         # Например: сложность (1-10) * базовую ставку 100
         #if round(comp, 2) == 2.62:
         #    comp = 0
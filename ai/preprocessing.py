@@ -0,0 +1,109 @@
+import os
+import re
+import json
+import hashlib
+
+# --- ОБЩИЕ ПАРАМЕТРЫ МОДЕЛИ ---
+# Единые для обучения, генератора датасета и бота
+MAX_WORDS = 10000
+MAX_LEN = 30
+
+# Правила нормализации текста. Сохраняются в метаданных модели:
+# при их изменении старую модель нужно переобучить
+NORMALIZATION = {
+    "version": 1,
+    "lowercase": True,
+    "keep": "letters_digits",  # всё, кроме букв, цифр и пробелов, удаляется
+    "collapse_spaces": True,
+}
+
+# Разделитель текстов при пакетной очистке (не буква, не цифра и не пробел)
+_SEPARATOR = '\x00'
+# Символы, которые удаляются: всё, кроме букв, цифр, пробельных символов (и разделителя)
+_DROP_RE = re.compile(r'[^\w\s\x00]|_')
+# Пробельные символы, кроме обычного пробела (\t, \n, неразрывный пробел...)
+_OTHER_SPACES_RE = re.compile(r'[^\S ]')
+
+
+def clean_text(text: str) -> str:
+    """Нормализация одной фразы (сообщение пользователя, ответ LLM, строка датасета)."""
+    if not text:
+        return ""
+    return " ".join(_DROP_RE.sub('', text.lower()).replace(_SEPARATOR, '').split())
+
+
+def clean_texts(texts) -> list:
+    """Пакетная версия clean_text для датасетов: результат тот же, что у [clean_text(t) for t in texts].
+
+    Тексты склеиваются через разделитель, и lower, удаление символов и
+    схлопывание пробелов выполняются по одному разу на весь массив
+    (~0.7 с вместо ~0.9 с на 180к строк).
+    """
+    texts = ["" if text is None else str(text) for text in texts]
+    if not texts:
+        return []
+    joined = _OTHER_SPACES_RE.sub(' ', _DROP_RE.sub('', _SEPARATOR.join(texts).lower()))
+    while '  ' in joined:
+        joined = joined.replace('  ', ' ')
+    joined = joined.replace(_SEPARATOR + ' ', _SEPARATOR).replace(' ' + _SEPARATOR, _SEPARATOR)
+    parts = joined.strip(' ').split(_SEPARATOR)
+    if len(parts) != len(texts):
+        # Разделитель встретился внутри текста — считаем по одному
+        return [clean_text(text) for text in texts]
+    return parts
+
+
+# --- МЕТАДАННЫЕ МОДЕЛИ ---
+
+def metadata_path(model_path):
+    """complexity_model.keras / .npz -> complexity_model.meta.json"""
+    return f"{os.path.splitext(model_path)[0]}.meta.json"
+
+
+def vocabulary_hash(vocabulary):
+    data = json.dumps([vocabulary.words, vocabulary.num_words, vocabulary.lower,
+                       vocabulary.filters, vocabulary.split], ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def build_metadata(vocabulary, max_len=MAX_LEN, max_words=MAX_WORDS):
+    return {
+        "max_len": max_len,
+        "max_words": max_words,
+        "normalization": NORMALIZATION,
+        "vocab_sha256": vocabulary_hash(vocabulary),
+    }
+
+
+def save_metadata(model_path, vocabulary, max_len=MAX_LEN, max_words=MAX_WORDS):
+    path = metadata_path(model_path)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(build_metadata(vocabulary, max_len, max_words), f, ensure_ascii=False, indent=2)
+    return path
+
+
+def load_metadata(model_path):
+    """Метаданные рядом с моделью или None, если модель обучена до их появления."""
+    path = metadata_path(model_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def check_metadata(metadata, vocabulary, model_max_len=None):
+    """Проверка, что модель, словарь и текущая предобработка согласованы.
+
+    Выбрасывает ValueError при расхождении.
+    """
+    problems = []
+    if metadata.get("normalization") != NORMALIZATION:
+        problems.append(f"нормализация текста {metadata.get('normalization')} != {NORMALIZATION}")
+    if model_max_len is not None and metadata.get("max_len") != model_max_len:
+        problems.append(f"max_len в метаданных {metadata.get('max_len')} != вход модели {model_max_len}")
+    if metadata.get("max_words") != vocabulary.num_words:
+        problems.append(f"max_words {metadata.get('max_words')} != словарь {vocabulary.num_words}")
+    if metadata.get("vocab_sha256") != vocabulary_hash(vocabulary):
+        problems.append("словарь не тот, с которым обучалась модель")
+    if problems:
+        raise ValueError("модель не согласована с предобработкой: " + "; ".join(problems))
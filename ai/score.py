@@ -0,0 +1,209 @@
+import os
+import json
+import math
+import time
+import argparse
+import multiprocessing
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from ai.predictor import XPAnalyst, BACKENDS, VOCAB_PATH
+from ai.preprocessing import clean_texts
+from ai.training_data import DATASET_DIR, detect_encoding
+
+# Строк CSV в одной задаче воркера: большой батч — один векторизованный проход модели
+BATCH_SIZE = 4096
+# Сколько батчей на воркер читается наперед (память ограничена при любом размере CSV)
+PREFETCH = 2
+DEFAULT_INPUT = os.path.join(DATASET_DIR, 'new_dataset.csv')
+
+# Модель воркера (загружается один раз на процесс в _init_worker)
+_analyst = None
+
+
+def _limit_threads():
+    """Один поток BLAS/OpenMP на процесс: параллелизм дают воркеры, а не потоки внутри них."""
+    for name in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS'):
+        os.environ.setdefault(name, '1')
+
+
+def _init_worker(backend, model_path, vocab_path):
+    global _analyst
+    # Кэш не нужен: повторы внутри батча XPAnalyst и так считает один раз
+    _analyst = XPAnalyst(model_path, vocab_path, backend=backend, cache_size=0)
+
+
+def _score_batch(texts):
+    """Сырой выход модели для батча текстов (очистка как в боте) в процессе воркера.
+
+    Ошибка загрузки модели всплывает через результат задачи: из
+    инициализатора пул перезапускал бы воркер бесконечно.
+    """
+    return _analyst.predict_batch(clean_texts(texts)).astype('float64')
+
+
+def iter_batches(path, text_column='text', label_column='complexity', batch_size=BATCH_SIZE):
+    """Потоковое чтение CSV (';', utf-16 или utf-8): (DataFrame, тексты, метки или None).
+
+    В отличие от обучения, строки не отбрасываются: каждая строка входа
+    получает предсказание, а нечисловые метки просто не входят в метрики.
+    """
+    reader = pd.read_csv(path, sep=';', encoding=detect_encoding(path), chunksize=batch_size)
+    for df in reader:
+        df.columns = df.columns.str.strip()
+        if text_column not in df.columns:
+            raise ValueError(f"в {path} нет колонки '{text_column}' (есть: {', '.join(df.columns)})")
+        texts = df[text_column].fillna('').astype(str).tolist()
+        labels = None
+        if label_column in df.columns:
+            labels = pd.to_numeric(df[label_column], errors='coerce').astype('float32').values
+        yield df, texts, labels
+
+
+class ErrorStats:
+    """Потоковые MAE/RMSE: суммы копятся по батчам, весь файл в памяти не держится."""
+
+    def __init__(self):
+        self.count = 0
+        self.abs_sum = 0.0
+        self.sq_sum = 0.0
+        self.max_error = 0.0
+        self.within_one = 0
+
+    def update(self, predictions, labels):
+        mask = np.isfinite(labels)
+        errors = predictions[mask].astype('float64') - labels[mask]
+        self.count += int(mask.sum())
+        self.abs_sum += float(np.abs(errors).sum())
+        self.sq_sum += float((errors ** 2).sum())
+        if errors.size:
+            self.max_error = max(self.max_error, float(np.abs(errors).max()))
+        self.within_one += int((np.abs(errors) <= 1.0).sum())
+
+    def summary(self):
+        if not self.count:
+            return None
+        return {
+            "labeled": self.count,
+            "mae": round(self.abs_sum / self.count, 4),
+            "rmse": round(math.sqrt(self.sq_sum / self.count), 4),
+            "max_error": round(self.max_error, 4),
+            "within_1": round(self.within_one / self.count, 4),
+        }
+
+
+def _scored_batches(batches, workers, backend, model_path, vocab_path):
+    """Предсказания по батчам в исходном порядке: в этом процессе или в пуле воркеров."""
+    if workers <= 1:
+        _init_worker(backend, model_path, vocab_path)
+        for batch in batches:
+            yield batch, _score_batch(batch[1])
+        return
+
+    _limit_threads()
+    # spawn: fork процесса с уже импортированным TensorFlow небезопасен
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers, _init_worker, (backend, model_path, vocab_path)) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append((batch, pool.apply_async(_score_batch, (batch[1],))))
+            # Не больше workers * PREFETCH батчей в работе — остальное еще не прочитано
+            if len(pending) >= workers * PREFETCH:
+                done, result = pending.popleft()
+                yield done, result.get()
+        while pending:
+            done, result = pending.popleft()
+            yield done, result.get()
+
+
+def score_file(path, output=None, workers=None, backend='numpy', model_path=None, vocab_path=VOCAB_PATH,
+               text_column='text', label_column='complexity', batch_size=BATCH_SIZE, output_encoding='utf-16'):
+    """Оценивает все строки CSV и пишет их в output с колонками predicted, xp, error.
+
+    Метрики и error считаются по сырому выходу модели, а predicted и xp —
+    то, что показал бы бот (сложность округлена до сотых).
+    Возвращает сводку: число строк, скорость и метрики (если есть колонка меток).
+    """
+    workers = workers or os.cpu_count() or 1
+    model_path = model_path or BACKENDS[backend][1]
+    stats = ErrorStats()
+    rows = 0
+    has_labels = False
+
+    out = open(output, 'w', encoding=output_encoding, newline='') if output else None
+    started = time.perf_counter()
+    try:
+        batches = iter_batches(path, text_column, label_column, batch_size)
+        for (df, texts, labels), predictions in _scored_batches(batches, workers, backend, model_path, vocab_path):
+            if labels is not None:
+                has_labels = True
+                stats.update(predictions, labels)
+            if out is not None:
+                df['predicted'] = np.round(predictions, 2)
+                # XP как в ответе бота: int(max(0, сложность * 100)) по неокругленной сложности
+                df['xp'] = np.maximum(0, predictions * 100).astype('int64')
+                if labels is not None:
+                    df['error'] = np.round(predictions - labels, 4)
+                # Один открытый поток: BOM utf-16 пишется только перед первым батчем
+                df.to_csv(out, sep=';', index=False, header=rows == 0)
+            rows += len(df)
+    finally:
+        if out is not None:
+            out.close()
+    seconds = time.perf_counter() - started
+
+    return {
+        "input": path,
+        "output": output,
+        "backend": backend,
+        "model": model_path,
+        "workers": workers,
+        "batch_size": batch_size,
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_s": round(rows / seconds, 1) if seconds else None,
+        "metrics": stats.summary() if has_labels else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная оценка CSV моделью XPAnalyst (MAE/RMSE по меткам)")
+    parser.add_argument("input", nargs="?", default=DEFAULT_INPUT, help="CSV с действиями (';', utf-16 или utf-8)")
+    parser.add_argument("--output", "-o", help="CSV с предсказаниями (без него — только метрики)")
+    parser.add_argument("--output-encoding", default="utf-16", help="кодировка выходного CSV")
+    parser.add_argument("--backend", default="numpy", choices=list(BACKENDS))
+    parser.add_argument("--model", default=None, help="файл модели (по умолчанию — рабочая модель бэкенда)")
+    parser.add_argument("--vocab", default=VOCAB_PATH)
+    parser.add_argument("--workers", type=int, default=None, help="процессов (по умолчанию — число CPU)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--text-column", default="text")
+    parser.add_argument("--label-column", default="complexity", help="колонка меток для MAE/RMSE (по сырому выходу модели), если есть")
+    parser.add_argument("--json", help="сохранить сводку в JSON")
+    args = parser.parse_args()
+
+    try:
+        summary = score_file(args.input, args.output, args.workers, args.backend, args.model, args.vocab,
+                             args.text_column, args.label_column, args.batch_size, args.output_encoding)
+    except (FileNotFoundError, ValueError, RuntimeError) as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+
+    print(f"📊 Строк: {summary['rows']} за {summary['seconds']} с ({summary['rows_per_s']} строк/с, "
+          f"воркеров: {summary['workers']}, бэкенд: {summary['backend']})")
+    metrics = summary["metrics"]
+    if metrics:
+        print(f"🎯 MAE: {metrics['mae']} | RMSE: {metrics['rmse']} | макс. ошибка: {metrics['max_error']} | "
+              f"в пределах ±1: {metrics['within_1'] * 100:.1f}% ({metrics['labeled']} размеченных)")
+    else:
+        print(f"ℹ️ Колонки '{args.label_column}' нет — метрики не посчитаны")
+    if args.output:
+        print(f"💾 Предсказания: {args.output}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
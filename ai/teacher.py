@@ -1,61 +1,102 @@
-import pandas as pd
 import numpy as np
 import tensorflow as tf
-import pickle
 import os
+import argparse
 from tensorflow.keras.preprocessing.text import Tokenizer
-from tensorflow.keras.preprocessing.sequence import pad_sequences
 from tensorflow.keras.callbacks import EarlyStopping
 
+from ai.numpy_model import NumpyComplexityModel
+from ai.preprocessing import MAX_WORDS, MAX_LEN, metadata_path, save_metadata
+from ai.vocabulary import Vocabulary
+from ai.training_data import TRAIN_SOURCES, SHARDS_DIR, ShardCache, iter_sources, is_validation
+
 # --- 1. НАСТРОЙКА ПУТЕЙ ---
 # Все модели и токенизаторы сохраняем в 'models', как ты просил
-MODELS_DIR = 'models'
-TOKENIZER_DIR = 'tokenizers'
-DATASET_DIR = 'dataset'
+# Пути считаются от папки ai/, чтобы не зависеть от текущей директории
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(BASE_DIR, 'models')
+TOKENIZER_DIR = os.path.join(BASE_DIR, 'tokenizers')
+DATASET_DIR = os.path.join(BASE_DIR, 'dataset')
 DATASET_PATH = os.path.join(DATASET_DIR, 'dataset.csv')
 
-# Константы для нейросети
-MAX_WORDS = 10000
-MAX_LEN = 30
+MODEL_PATH = os.path.join(MODELS_DIR, 'complexity_model.keras')
+NUMPY_MODEL_PATH = os.path.join(MODELS_DIR, 'complexity_model.npz')
+VOCAB_PATH = os.path.join(TOKENIZER_DIR, 'vocab.json')
 
+# Потоковая загрузка: размер буфера перемешивания и батча
+SHUFFLE_BUFFER = 10000
+BATCH_SIZE = 64
 
-def load_data(path):
-    """Загрузка данных с защитой от ошибок типа (Dtype error)."""
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"❌ Ошибка: Файл {path} не найден.")
 
-    # Пытаемся прочитать с учетом твоей кодировки
-    try:
-        df = pd.read_csv(path, sep=';', encoding='utf-16')
-    except Exception:
-        df = pd.read_csv(path, sep=';', encoding='utf-8')
+def fit_vocabulary(paths):
+    """Первый проход: словарь по всем текстам и счетчики строк (данные в памяти не копятся)."""
+    tokenizer = Tokenizer(num_words=MAX_WORDS, lower=True)
+    counts = {'train': 0, 'val': 0, 'dropped': 0}
+
+    def texts():
+        for chunk_texts, _ in iter_sources(paths, stats=counts):
+            for text in chunk_texts:
+                counts['val' if is_validation(text) else 'train'] += 1
+                yield text
+
+    tokenizer.fit_on_texts(texts())
+    # Сохраняем только top MAX_WORDS слов в компактном формате vocab.json
+    return Vocabulary.from_tokenizer(tokenizer, MAX_WORDS), counts
+
+
+def make_dataset(paths, vocabulary, validation, rows=None, batch_size=BATCH_SIZE, shuffle_buffer=SHUFFLE_BUFFER):
+    """tf.data поток: чтение кусками, токенизация и паддинг на лету, перемешивание буфером.
 
-    # Очистка имен колонок
-    df.columns = df.columns.str.strip()
+    rows — число строк из первого прохода: с ним Keras знает длину эпохи.
+    """
 
-    # ИСПРАВЛЕНИЕ ОШИБКИ DTYPE:
-    # Превращаем колонку сложности в числа. Если там текст — станет NaN
-    df['complexity'] = pd.to_numeric(df['complexity'], errors='coerce')
+    def generate():
+        for texts, labels in iter_sources(paths):
+            mask = np.array([is_validation(text) == validation for text in texts], dtype=bool)
+            if mask.any():
+                selected = [text for text, keep in zip(texts, mask) if keep]
+                yield vocabulary.texts_to_padded(selected, MAX_LEN), labels[mask]
 
-    # Удаляем пустые строки или строки, где сложность не определилась
-    initial_count = len(df)
-    df = df.dropna(subset=['complexity', 'text'])
+    return _batch_stream(generate, validation, rows, batch_size, shuffle_buffer)
 
-    # Убеждаемся, что текст — это действительно строки
-    df['text'] = df['text'].astype(str)
 
-    if len(df) < initial_count:
-        print(f"⚠️ Удалено {initial_count - len(df)} некорректных строк (мусор/ошибки форматирования).")
+def make_shard_dataset(cache, validation, rows=None, batch_size=BATCH_SIZE, shuffle_buffer=SHUFFLE_BUFFER):
+    """tf.data поток из .npy шардов (mmap): тексты не разбираются заново."""
 
-    # Перемешиваем (важно, так как у тебя мусор в начале файла!)
-    df = df.sample(frac=1, random_state=42).reset_index(drop=True)
+    def generate():
+        for padded, labels, val in cache.iter_shards():
+            mask = np.asarray(val) == validation
+            if mask.any():
+                yield padded[mask], labels[mask]
 
-    sentences = df['text'].tolist()
-    # Принудительно в float32 для TensorFlow
-    labels = df['complexity'].astype('float32').values
+    return _batch_stream(generate, validation, rows, batch_size, shuffle_buffer)
 
-    print(f"✅ Данные загружены! Чистых строк для обучения: {len(df)}")
-    return sentences, labels
+
+def _batch_stream(generate, validation, rows, batch_size, shuffle_buffer):
+    dataset = tf.data.Dataset.from_generator(generate, output_signature=(
+        tf.TensorSpec(shape=(None, MAX_LEN), dtype=tf.int32),
+        tf.TensorSpec(shape=(None,), dtype=tf.float32),
+    )).unbatch()
+    if not validation:
+        # Буфер ограничен — память не растет с размером датасета
+        dataset = dataset.shuffle(shuffle_buffer, seed=42, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    if rows:
+        dataset = dataset.apply(tf.data.experimental.assert_cardinality(-(-rows // batch_size)))
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def take_sample(paths, vocabulary, size):
+    """Первые size строк валидационной выборки для проверки экспорта."""
+    padded, labels = [], []
+    for batch_padded, batch_labels in make_dataset(paths, vocabulary, validation=True).as_numpy_iterator():
+        padded.append(batch_padded)
+        labels.append(batch_labels)
+        if sum(len(chunk) for chunk in labels) >= size:
+            break
+    if not labels:
+        raise ValueError("нет данных для проверки экспорта")
+    return np.concatenate(padded)[:size], np.concatenate(labels)[:size]
 
 
 def create_model():
@@ -75,22 +116,91 @@ def create_model():
     return model
 
 
-def main():
+def export_numpy_weights(model, path):
+    """Экспорт весов в .npz для сервинга без TensorFlow (бэкенд 'numpy')."""
+    weights = {}
+    dense_index = 0
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.layers.Embedding):
+            weights['embedding'] = layer.get_weights()[0]
+        elif isinstance(layer, tf.keras.layers.Bidirectional):
+            for prefix, lstm in (('forward', layer.forward_layer), ('backward', layer.backward_layer)):
+                kernel, recurrent_kernel, bias = lstm.get_weights()
+                weights[f'{prefix}_kernel'] = kernel
+                weights[f'{prefix}_recurrent_kernel'] = recurrent_kernel
+                weights[f'{prefix}_bias'] = bias
+        elif isinstance(layer, tf.keras.layers.Dense):
+            kernel, bias = layer.get_weights()
+            weights[f'dense{dense_index}_kernel'] = kernel
+            weights[f'dense{dense_index}_bias'] = bias
+            dense_index += 1
+
+    np.savez(path, max_len=np.int32(model.input_shape[1]), **weights)
+    print(f"📦 Веса для NumPy-бэкенда сохранены: {path}")
+
+
+def verify_export(model, path, padded_data, labels=None, tolerance=1e-3):
+    """Проверка, что экспортированная модель совпадает с .keras по предсказаниям."""
+    expected = model.predict(padded_data, verbose=0).reshape(-1)
+    actual = NumpyComplexityModel.load(path).predict(padded_data).reshape(-1)
+
+    max_diff = float(np.max(np.abs(expected - actual)))
+    print(f"🔍 Расхождение экспорта на {len(padded_data)} примерах: max |Δ| = {max_diff:.6f}")
+    if labels is not None:
+        keras_mae = float(np.mean(np.abs(expected - labels)))
+        export_mae = float(np.mean(np.abs(actual - labels)))
+        print(f"🔍 MAE .keras: {keras_mae:.4f} | MAE экспорта: {export_mae:.4f}")
+
+    if max_diff > tolerance:
+        raise ValueError(f"Экспорт расходится с .keras моделью: {max_diff:.6f} > {tolerance}")
+    return max_diff
+
+
+def export_existing(sources=None):
+    """Экспорт уже обученной модели без переобучения."""
+    model = tf.keras.models.load_model(MODEL_PATH, compile=False)
+    vocabulary = Vocabulary.load(VOCAB_PATH)
+
+    padded_data, labels = take_sample(sources or TRAIN_SOURCES, vocabulary, 2000)
+
+    export_numpy_weights(model, NUMPY_MODEL_PATH)
+    verify_export(model, NUMPY_MODEL_PATH, padded_data, labels)
+
+    # Модели, обученные до появления метаданных
+    if not os.path.exists(metadata_path(MODEL_PATH)):
+        path = save_metadata(MODEL_PATH, vocabulary, model.input_shape[1])
+        print(f"📦 Метаданные предобработки сохранены: {path}")
+
+
+def main(sources=None, use_shards=True):
     # Создаем папку для моделей, если её нет
     os.makedirs(MODELS_DIR, exist_ok=True)
+    sources = sources or TRAIN_SOURCES
 
-    # 1. Загрузка
+    # 1. Словарь (Токенизация) и подсчет строк: из кэша шардов или первым проходом по CSV
     try:
-        sentences, labels = load_data(DATASET_PATH)
+        if use_shards:
+            cache = ShardCache(SHARDS_DIR, MAX_WORDS, MAX_LEN)
+            vocabulary, counts = cache.build(sources)
+        else:
+            vocabulary, counts = fit_vocabulary(sources)
     except Exception as e:
         print(f"❌ Критическая ошибка: {e}")
         return
-
-    # 2. Подготовка текста (Токенизация)
-    tokenizer = Tokenizer(num_words=MAX_WORDS, lower=True)
-    tokenizer.fit_on_texts(sentences)
-    sequences = tokenizer.texts_to_sequences(sentences)
-    padded_data = pad_sequences(sequences, maxlen=MAX_LEN)
+    if not counts['train'] or not counts['val']:
+        print(f"❌ Критическая ошибка: нет данных для обучения в {', '.join(sources)}")
+        return
+    if counts['dropped']:
+        print(f"⚠️ Пропущено {counts['dropped']} некорректных строк (мусор/ошибки форматирования).")
+    print(f"✅ Данные найдены! Строк для обучения: {counts['train']}, для валидации: {counts['val']}")
+
+    # 2. Потоки данных: читаются с диска заново на каждой эпохе
+    if use_shards:
+        train_data = make_shard_dataset(cache, validation=False, rows=counts['train'])
+        val_data = make_shard_dataset(cache, validation=True, rows=counts['val'])
+    else:
+        train_data = make_dataset(sources, vocabulary, validation=False, rows=counts['train'])
+        val_data = make_dataset(sources, vocabulary, validation=True, rows=counts['val'])
 
     # 3. Обучение
     model = create_model()
@@ -105,27 +215,41 @@ def main():
 
     print(f"\n🚀 Обучение начато...")
     model.fit(
-        padded_data,
-        labels,
+        train_data,
         epochs=100,
-        batch_size=64,
-        validation_split=0.15,
+        validation_data=val_data,
         callbacks=[early_stop],
         verbose=1
     )
 
     # 4. Сохранение результатов в папку models
-    model_path = os.path.join(MODELS_DIR, 'complexity_model.keras')
-    tokenizer_path = os.path.join(TOKENIZER_DIR, 'tokenizer.pickle')
+    model.save(MODEL_PATH)
+    vocabulary.save(VOCAB_PATH)
+    # max_len, словарь и правила нормализации: бот сверяет их при загрузке
+    save_metadata(MODEL_PATH, vocabulary)
 
-    model.save(model_path)
-    with open(tokenizer_path, 'wb') as f:
-        pickle.dump(tokenizer, f)
+    # 5. Экспорт для лёгкого сервинга и проверка расхождения
+    export_numpy_weights(model, NUMPY_MODEL_PATH)
+    sample_data, sample_labels = take_sample(sources, vocabulary, 2000)
+    verify_export(model, NUMPY_MODEL_PATH, sample_data, sample_labels)
 
     print(f"\n✨ Обучение завершено успешно!")
-    print(f"📦 Модель сохранена: {model_path}")
-    print(f"📦 Токенизатор сохранен: {tokenizer_path}")
+    print(f"📦 Модель сохранена: {MODEL_PATH}")
+    print(f"📦 Словарь сохранен: {VOCAB_PATH}")
+    print(f"📦 Метаданные: {metadata_path(MODEL_PATH)}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Обучение модели сложности")
+    parser.add_argument("--export", action="store_true",
+                        help="только экспортировать уже обученную модель в .npz")
+    parser.add_argument("--sources", nargs="+", default=None,
+                        help="CSV для обучения (по умолчанию dataset, new_dataset и good/bad_user_dataset)")
+    parser.add_argument("--no-shards", action="store_true",
+                        help="читать CSV напрямую, без кэша токенизированных шардов")
+    args = parser.parse_args()
+
+    if args.export:
+        export_existing(args.sources)
+    else:
+        main(args.sources, use_shards=not args.no_shards)
\ No newline at end of file
@@ -0,0 +1,287 @@
+import os
+import re
+import glob
+import json
+import zlib
+import hashlib
+import argparse
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from ai.preprocessing import clean_texts
+from ai.vocabulary import Vocabulary
+
+# --- НАСТРОЙКИ ПУТЕЙ ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASET_DIR = os.path.join(BASE_DIR, 'dataset')
+SHARDS_DIR = os.path.join(BASE_DIR, 'shards')
+MANIFEST_NAME = 'manifest.json'
+
+# Источники обучения читаются за один проход (отсутствующие пропускаются)
+TRAIN_SOURCES = [
+    os.path.join(DATASET_DIR, 'dataset.csv'),
+    os.path.join(DATASET_DIR, 'new_dataset.csv'),
+    os.path.join(DATASET_DIR, 'good_user_dataset.csv'),
+    os.path.join(DATASET_DIR, 'bad_user_dataset.csv'),
+]
+
+# Строк в куске CSV (и в одном шарде), доля валидации (%)
+CHUNK_SIZE = 5000
+VALIDATION_PERCENT = 15
+
+# Версия формата шардов: при изменении токенизации все шарды пересобираются
+SHARDS_VERSION = 2
+# Имена файлов шардов: {источник}-{sha256[:12]}-{номер}.* и {источник}-{sha256[:12]}.words.json
+SHARD_FILE_RE = re.compile(r'^.+-[0-9a-f]{12}(-\d{5}\..+|\.words\.json)$')
+
+
+# --- Потоковое чтение CSV ---
+
+def detect_encoding(path):
+    """Кодировка CSV по BOM (датасеты бота — utf-16, ручные правки часто в utf-8)."""
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    if head.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return 'utf-16'
+    if head.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    return 'utf-8'
+
+
+def iter_chunks(path, chunksize=CHUNK_SIZE, stats=None):
+    """Чтение CSV кусками по chunksize строк: (тексты, сложности float32).
+
+    Строки с нечисловой сложностью или пустым текстом отбрасываются
+    (защита от ошибок типа Dtype error), их число копится в stats['dropped'].
+    """
+    reader = pd.read_csv(path, sep=';', encoding=detect_encoding(path), chunksize=chunksize)
+    for df in reader:
+        # Очистка имен колонок
+        df.columns = df.columns.str.strip()
+        # Превращаем колонку сложности в числа. Если там текст — станет NaN
+        df['complexity'] = pd.to_numeric(df['complexity'], errors='coerce')
+        initial_count = len(df)
+        df = df.dropna(subset=['complexity', 'text'])
+        if stats is not None:
+            stats['dropped'] = stats.get('dropped', 0) + initial_count - len(df)
+        # Та же нормализация, что у генератора датасета и у бота
+        yield clean_texts(df['text'].astype(str).tolist()), df['complexity'].astype('float32').values
+
+
+def iter_sources(paths, chunksize=CHUNK_SIZE, stats=None):
+    """Один проход по всем источникам подряд (отсутствующие файлы пропускаются)."""
+    for path in paths:
+        if os.path.exists(path):
+            yield from iter_chunks(path, chunksize, stats)
+
+
+def is_validation(text):
+    """Стабильное разбиение по хешу текста: одинаковые фразы всегда в одной выборке."""
+    return zlib.crc32(text.encode('utf-8')) % 100 < VALIDATION_PERCENT
+
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+# --- Кэш токенизированных шардов ---
+
+def vocabulary_from_counts(word_counts, num_words):
+    """Словарь как у Tokenizer.fit_on_texts: по убыванию частоты, при равенстве — по первому появлению."""
+    ordered = sorted(word_counts.items(), key=lambda item: item[1], reverse=True)
+    return Vocabulary([word for word, _ in ordered[:num_words - 1]], num_words)
+
+
+def vocabulary_hash(vocabulary, max_len):
+    data = json.dumps([vocabulary.words, vocabulary.num_words, vocabulary.lower,
+                       vocabulary.filters, vocabulary.split, max_len], ensure_ascii=False)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()[:12]
+
+
+def pad_ragged(ids, lengths, maxlen):
+    """Паддинг 'pre' плоского массива id с длинами строк (id 0 — слово вне словаря, выкидывается)."""
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    keep = ids != 0
+    ids, rows = ids[keep], rows[keep]
+
+    new_lengths = np.bincount(rows, minlength=len(lengths))
+    starts = np.concatenate(([0], np.cumsum(new_lengths)[:-1]))
+    # Позиция слова с конца строки: 1 — последнее слово
+    from_end = new_lengths[rows] - (np.arange(len(ids)) - starts[rows])
+    tail = from_end <= maxlen
+
+    padded = np.zeros((len(lengths), maxlen), dtype=np.int32)
+    padded[rows[tail], maxlen - from_end[tail]] = ids[tail]
+    return padded
+
+
+class ShardCache:
+    """Предобработанные данные обучения в .npy шардах.
+
+    Этап 1 (на каждый источник, ключ — sha256 файла): слова каждой строки в
+    локальных id источника, метки float32 и признак валидации. Пересобирается
+    только для изменившихся CSV.
+    Этап 2 (ключ — источник + хеш словаря): паддинг int32 под общий словарь,
+    собирается из этапа 1 на NumPy без повторной обработки текста.
+
+    Обучение читает шарды через np.load(mmap_mode='r').
+    """
+
+    def __init__(self, cache_dir=SHARDS_DIR, num_words=10000, max_len=30):
+        self.cache_dir = cache_dir
+        self.num_words = num_words
+        self.max_len = max_len
+        self.manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == SHARDS_VERSION:
+                return manifest
+        return {'version': SHARDS_VERSION, 'sources': {}}
+
+    def _save_manifest(self):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    # --- Этап 1: токенизация изменившихся источников ---
+
+    def _tokenize_source(self, path, digest):
+        prefix = f"{os.path.splitext(os.path.basename(path))[0]}-{digest[:12]}"
+        splitter = Vocabulary([])
+        local_ids = OrderedDict()  # слово -> локальный id (с 1), порядок первого появления
+        counts = {}
+        stats = {'dropped': 0}
+        entry = {'sha256': digest, 'prefix': prefix, 'chunks': 0, 'train': 0, 'val': 0}
+
+        for texts, labels in iter_chunks(path, stats=stats):
+            ids, lengths = [], []
+            for text in texts:
+                words = splitter.text_to_words(text)
+                for word in words:
+                    counts[word] = counts.get(word, 0) + 1
+                    ids.append(local_ids.setdefault(word, len(local_ids) + 1))
+                lengths.append(len(words))
+            val = np.array([is_validation(text) for text in texts], dtype=bool)
+
+            name = f"{prefix}-{entry['chunks']:05d}"
+            np.savez(self._path(f"{name}.tokens.npz"),
+                     ids=np.array(ids, dtype=np.int32), lengths=np.array(lengths, dtype=np.int32))
+            np.save(self._path(f"{name}.labels.npy"), labels.astype(np.float32))
+            np.save(self._path(f"{name}.val.npy"), val)
+            entry['chunks'] += 1
+            entry['val'] += int(val.sum())
+            entry['train'] += int(len(val) - val.sum())
+
+        with open(self._path(f"{prefix}.words.json"), 'w', encoding='utf-8') as f:
+            json.dump({'words': list(local_ids), 'counts': [counts[w] for w in local_ids]}, f, ensure_ascii=False)
+        entry['dropped'] = stats['dropped']
+        return entry
+
+    def _load_words(self, entry):
+        with open(self._path(f"{entry['prefix']}.words.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _stage1_ready(self, entry):
+        return os.path.exists(self._path(f"{entry['prefix']}.words.json")) and all(
+            os.path.exists(self._path(f"{entry['prefix']}-{i:05d}.tokens.npz")) for i in range(entry['chunks'])
+        )
+
+    # --- Этап 2: паддинг под общий словарь ---
+
+    def _pad_source(self, entry, vocabulary, vocab_hash):
+        words = self._load_words(entry)['words']
+        # Локальный id -> id общего словаря (0 — вне словаря)
+        lookup = np.zeros(len(words) + 1, dtype=np.int32)
+        lookup[1:] = [vocabulary.word_index.get(word, 0) for word in words]
+
+        for i in range(entry['chunks']):
+            name = f"{entry['prefix']}-{i:05d}"
+            padded_path = self._path(f"{name}.{vocab_hash}.padded.npy")
+            if os.path.exists(padded_path):
+                continue
+            with np.load(self._path(f"{name}.tokens.npz")) as tokens:
+                padded = pad_ragged(lookup[tokens['ids']], tokens['lengths'], self.max_len)
+            np.save(padded_path, padded)
+
+    def build(self, sources):
+        """Готовит шарды для источников, возвращает (словарь, счетчики строк)."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = OrderedDict()
+        for path in sources:
+            if not os.path.exists(path):
+                continue
+            key = os.path.abspath(path)
+            digest = file_hash(path)
+            entry = self.manifest['sources'].get(key)
+            if entry is None or entry['sha256'] != digest or not self._stage1_ready(entry):
+                print(f"🔄 Токенизация {os.path.basename(path)}...")
+                entry = self._tokenize_source(path, digest)
+            entries[key] = entry
+
+        # Общий словарь из частот слов по источникам (в порядке источников, как при одном проходе)
+        word_counts = OrderedDict()
+        for entry in entries.values():
+            data = self._load_words(entry)
+            for word, count in zip(data['words'], data['counts']):
+                word_counts[word] = word_counts.get(word, 0) + count
+        vocabulary = vocabulary_from_counts(word_counts, self.num_words)
+        vocab_hash = vocabulary_hash(vocabulary, self.max_len)
+
+        for entry in entries.values():
+            self._pad_source(entry, vocabulary, vocab_hash)
+
+        self.manifest.update({'sources': dict(entries), 'vocab_hash': vocab_hash,
+                              'max_len': self.max_len, 'num_words': self.num_words})
+        self._save_manifest()
+        self._remove_stale(entries.values(), vocab_hash)
+
+        counts = {name: sum(entry[name] for entry in entries.values()) for name in ('train', 'val', 'dropped')}
+        return vocabulary, counts
+
+    def _remove_stale(self, entries, vocab_hash):
+        """Удаляет шарды старых версий источников и старых словарей."""
+        keep = {self.manifest_path}
+        for entry in entries:
+            keep.add(self._path(f"{entry['prefix']}.words.json"))
+            for i in range(entry['chunks']):
+                name = f"{entry['prefix']}-{i:05d}"
+                keep.update(self._path(f"{name}.{suffix}") for suffix in
+                            ('tokens.npz', 'labels.npy', 'val.npy', f'{vocab_hash}.padded.npy'))
+        for path in glob.glob(self._path('*')):
+            if path not in keep and SHARD_FILE_RE.match(os.path.basename(path)):
+                os.remove(path)
+
+    def iter_shards(self):
+        """(padded, labels, val) каждого шарда текущего словаря, отображенные в память."""
+        vocab_hash = self.manifest['vocab_hash']
+        for entry in self.manifest['sources'].values():
+            for i in range(entry['chunks']):
+                name = f"{entry['prefix']}-{i:05d}"
+                yield (np.load(self._path(f"{name}.{vocab_hash}.padded.npy"), mmap_mode='r'),
+                       np.load(self._path(f"{name}.labels.npy"), mmap_mode='r'),
+                       np.load(self._path(f"{name}.val.npy"), mmap_mode='r'))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Предобработка датасетов в .npy шарды")
+    parser.add_argument("--sources", nargs="+", default=TRAIN_SOURCES)
+    parser.add_argument("--cache-dir", default=SHARDS_DIR)
+    args = parser.parse_args()
+
+    vocabulary, counts = ShardCache(args.cache_dir).build(args.sources)
+    print(f"✅ Шарды готовы: обучение {counts['train']}, валидация {counts['val']}, "
+          f"словарь {len(vocabulary.words)} слов -> {args.cache_dir}")
@@ -0,0 +1,141 @@
+import os
+import json
+import pickle
+import argparse
+import collections
+
+import numpy as np
+
+# --- НАСТРОЙКИ ПУТЕЙ ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TOKENIZERS_DIR = os.path.join(BASE_DIR, 'tokenizers')
+
+VOCAB_PATH = os.path.join(TOKENIZERS_DIR, 'vocab.json')
+TOKENIZER_PATH = os.path.join(TOKENIZERS_DIR, 'tokenizer.pickle')
+
+# Фильтры по умолчанию у keras Tokenizer
+DEFAULT_FILTERS = '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n'
+
+
+def pad_sequences(sequences, maxlen):
+    """Аналог keras pad_sequences (padding и truncating 'pre') без TensorFlow."""
+    padded = np.zeros((len(sequences), maxlen), dtype=np.int32)
+    for row, seq in enumerate(sequences):
+        seq = seq[-maxlen:]
+        if seq:
+            padded[row, -len(seq):] = seq
+    return padded
+
+
+class Vocabulary:
+    """Компактный словарь вместо pickle keras Tokenizer.
+
+    Хранит только слова, которые реально использует модель (id < num_words),
+    в порядке id: words[0] имеет id 1. Токенизация повторяет
+    Tokenizer.texts_to_sequences с теми же lower/filters/split.
+    """
+
+    def __init__(self, words, num_words=None, lower=True, filters=DEFAULT_FILTERS, split=' '):
+        self.words = list(words)
+        self.num_words = num_words or len(self.words) + 1
+        self.lower = lower
+        self.filters = filters
+        self.split = split
+        self.word_index = {word: i for i, word in enumerate(self.words, start=1)}
+        self._translate = str.maketrans({c: split for c in filters})
+
+    @classmethod
+    def load(cls, path=VOCAB_PATH):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['words'], data['num_words'], data['lower'], data['filters'], data['split'])
+
+    def save(self, path=VOCAB_PATH):
+        data = {
+            'num_words': self.num_words,
+            'lower': self.lower,
+            'filters': self.filters,
+            'split': self.split,
+            'words': self.words,
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    @classmethod
+    def from_word_index(cls, word_index, num_words, lower=True, filters=DEFAULT_FILTERS, split=' '):
+        """Словарь из word_index обученного токенизатора (id 1..num_words-1)."""
+        ordered = sorted((i, word) for word, i in word_index.items() if i < num_words)
+        return cls([word for _, word in ordered], num_words, lower, filters, split)
+
+    @classmethod
+    def from_tokenizer(cls, tokenizer, num_words=None):
+        """Словарь из keras Tokenizer (или его восстановленного состояния)."""
+        return cls.from_word_index(
+            tokenizer.word_index,
+            num_words or tokenizer.num_words,
+            tokenizer.lower,
+            tokenizer.filters,
+            tokenizer.split,
+        )
+
+    def text_to_words(self, text):
+        if self.lower:
+            text = text.lower()
+        return [word for word in text.translate(self._translate).split(self.split) if word]
+
+    def texts_to_sequences(self, texts):
+        """Те же id, что и у Tokenizer.texts_to_sequences (слова вне словаря пропускаются)."""
+        get = self.word_index.get
+        sequences = []
+        for text in texts:
+            ids = (get(word) for word in self.text_to_words(text))
+            sequences.append([i for i in ids if i is not None])
+        return sequences
+
+    def texts_to_padded(self, texts, maxlen):
+        return pad_sequences(self.texts_to_sequences(texts), maxlen)
+
+
+class _TokenizerState:
+    """Заглушка для состояния keras Tokenizer при чтении старого pickle."""
+
+
+class _SafeTokenizerUnpickler(pickle.Unpickler):
+    """Разрешает только классы, которые есть в pickle keras Tokenizer."""
+
+    ALLOWED = {
+        ('collections', 'OrderedDict'): collections.OrderedDict,
+        ('collections', 'defaultdict'): collections.defaultdict,
+        ('builtins', 'int'): int,
+    }
+    TOKENIZER_MODULES = (
+        'keras.src.legacy.preprocessing.text',
+        'keras.preprocessing.text',
+        'keras_preprocessing.text',
+    )
+
+    def find_class(self, module, name):
+        if name == 'Tokenizer' and module in self.TOKENIZER_MODULES:
+            return _TokenizerState
+        if (module, name) in self.ALLOWED:
+            return self.ALLOWED[(module, name)]
+        raise pickle.UnpicklingError(f"запрещенный класс в pickle токенизатора: {module}.{name}")
+
+
+def convert_pickle(tokenizer_path=TOKENIZER_PATH, vocab_path=VOCAB_PATH):
+    """Конвертация старого tokenizer.pickle в vocab.json без импорта Keras."""
+    with open(tokenizer_path, 'rb') as f:
+        tokenizer = _SafeTokenizerUnpickler(f).load()
+    vocabulary = Vocabulary.from_tokenizer(tokenizer)
+    vocabulary.save(vocab_path)
+    print(f"📦 Словарь сохранен: {vocab_path} ({len(vocabulary.words)} слов)")
+    return vocabulary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Конвертация tokenizer.pickle в vocab.json")
+    parser.add_argument("--tokenizer", default=TOKENIZER_PATH)
+    parser.add_argument("--vocab", default=VOCAB_PATH)
+    args = parser.parse_args()
+    convert_pickle(args.tokenizer, args.vocab)
@@ -9,4 +9,63 @@ AI_API_KEY = os.getenv("AI_API_KEY")
 BASE_URL = os.getenv("BASE_URL")
 
 if not BOT_TOKEN:
-    exit("Ошибка: TELEGRAM_BOT_TOKEN не установлен!")
\ No newline at end of file
+    exit("Ошибка: TELEGRAM_BOT_TOKEN не установлен!")
+
+# Микро-батчинг инференса: максимум текстов в батче и окно ожидания (мс)
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", 32))
+INFERENCE_BATCH_DELAY_MS = float(os.getenv("INFERENCE_BATCH_DELAY_MS", 10))
+
+# Пул инференса: число потоков, лимит ожидающих задач и таймаут (сек)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 1))
+INFERENCE_MAX_PENDING = int(os.getenv("INFERENCE_MAX_PENDING", 64))
+INFERENCE_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", 10))
+
+# Бэкенд инференса: keras (TensorFlow) или numpy (веса .npz без TensorFlow)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "keras")
+
+# Как часто проверять файлы модели и словаря для горячей перезагрузки (сек, 0 — не следить)
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", 30))
+
+# Сколько сек запрос ждет первой загрузки модели после старта бота, прежде чем попросить повторить
+MODEL_READY_WAIT = float(os.getenv("MODEL_READY_WAIT", 5))
+
+# Размер LRU-кэша предсказаний (0 — отключить)
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", 4096))
+
+# Хранилище логов и обратной связи: csv или sqlite
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "csv")
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join("logs", "bot.sqlite3"))
+
+# Фоновая запись логов: размер пачки и максимальная задержка (сек)
+LOG_FLUSH_BATCH_SIZE = int(os.getenv("LOG_FLUSH_BATCH_SIZE", 100))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", 1.0))
+
+# HTTP /metrics в формате Prometheus (0 — не запускать) и адрес, на котором он слушает
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# Сообщения админу: не чаще ADMIN_RATE_PER_SECOND в секунду, всплеск до ADMIN_BURST
+ADMIN_RATE_PER_SECOND = float(os.getenv("ADMIN_RATE_PER_SECOND", 1.0))
+ADMIN_BURST = int(os.getenv("ADMIN_BURST", 3))
+
+# FSM-состояния пользователей: memory (по умолчанию), sqlite или redis (общие для нескольких процессов)
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+FSM_SQLITE_PATH = os.getenv("FSM_SQLITE_PATH", os.path.join("logs", "fsm.sqlite3"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Через сколько секунд без изменений брошенное состояние удаляется
+FSM_TTL = float(os.getenv("FSM_TTL", 24 * 60 * 60))
+
+# Режим получения апдейтов: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Webhook: где слушать, публичный URL для setWebhook (пусто — не регистрировать) и секрет заголовка
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Пул обработчиков апдейтов, размер очереди (сверх — 503) и сколько ждать очередь при остановке (сек)
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 16))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", 30))
+# Свой Bot API сервер (telegram-bot-api или заглушка для нагрузочного теста), пусто — api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType, DefaultKeyBuilder
+from aiogram.fsm.storage.memory import MemoryStorage
+
+# Брошенные состояния (пользователь не ввел исправление) удаляются через сутки
+FSM_TTL = 24 * 60 * 60
+# Как часто чистить просроченные записи (сек)
+CLEANUP_INTERVAL = 10 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL DEFAULT '{}',
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_fsm_expires ON fsm(expires_at);
+"""
+
+
+def _state_name(state: StateType):
+    return state.state if isinstance(state, State) else state
+
+
+class SQLiteFSMStorage(BaseStorage):
+    """FSM-хранилище aiogram в SQLite (WAL): переживает рестарт и общее для нескольких процессов бота.
+
+    Каждая запись живет ttl секунд с последнего изменения, просроченные
+    записи не читаются и периодически удаляются. Запросы выполняются в
+    отдельном потоке (одно соединение на процесс), update_data — одной
+    транзакцией, чтобы параллельные процессы не затирали данные друг друга.
+    """
+
+    DB_PATH = os.path.join('logs', 'fsm.sqlite3')
+
+    def __init__(self, path=None, ttl: float = FSM_TTL, cleanup_interval: float = CLEANUP_INTERVAL):
+        self.path = path or self.DB_PATH
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_business_connection_id=True, with_destiny=True)
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-sqlite")
+        # isolation_level=None: транзакции открываются явно (BEGIN IMMEDIATE)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Другой процесс может держать запись: ждем, а не падаем с "database is locked"
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        self._last_cleanup = 0.0
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    # --- Синхронная часть (поток fsm-sqlite) ---
+
+    def _read(self, key):
+        row = self._conn.execute(
+            "SELECT state, data FROM fsm WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None, {}
+        return row[0], json.loads(row[1])
+
+    def _write(self, key, state, data):
+        """Записывает состояние и данные (внутри открытой транзакции)."""
+        now = time.time()
+        if state is None and not data:
+            self._conn.execute("DELETE FROM fsm WHERE key = ?", (key,))
+        else:
+            self._conn.execute(
+                "INSERT INTO fsm (key, state, data, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, "
+                "expires_at = excluded.expires_at",
+                (key, state, json.dumps(data, ensure_ascii=False), now + self.ttl),
+            )
+        if now - self._last_cleanup > self.cleanup_interval:
+            self._conn.execute("DELETE FROM fsm WHERE expires_at <= ?", (now,))
+            self._last_cleanup = now
+
+    def _modify(self, key, update):
+        """Чтение и запись одной транзакцией: update(state, data) -> (state, data)."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            state, data = update(*self._read(key))
+            self._write(key, state, data)
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return state, data
+
+    # --- Интерфейс BaseStorage ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        name = _state_name(state)
+        await self._run(self._modify, self.key_builder.build(key), lambda _, data: (name, data))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._run(self._read, self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        data = dict(data)
+        await self._run(self._modify, self.key_builder.build(key), lambda state, _: (state, data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._run(self._read, self.key_builder.build(key))
+        return data
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+        def update(state, current):
+            current.update(data)
+            return state, current
+
+        _, result = await self._run(self._modify, self.key_builder.build(key), update)
+        return dict(result)
+
+    async def close(self) -> None:
+        if self._conn is None:
+            return
+        await self._run(self._conn.close)
+        self._conn = None
+        self._executor.shutdown(wait=True)
+
+    # --- Обслуживание ---
+
+    def count(self):
+        """Активные (не просроченные) состояния — для метрик и проверки."""
+        return self._conn.execute("SELECT COUNT(*) FROM fsm WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+
+
+def create_fsm_storage(backend: str = 'memory', sqlite_path=None, redis_url=None, ttl: float = FSM_TTL):
+    """FSM-хранилище по имени бэкенда: memory, sqlite или redis.
+
+    Для redis нужен пакет redis (pip install redis); подойдет любой
+    совместимый сервер (Redis, Valkey, KeyDB), в том числе локальный.
+    """
+    if backend == 'memory':
+        return MemoryStorage()
+    if backend == 'sqlite':
+        return SQLiteFSMStorage(sqlite_path, ttl)
+    if backend == 'redis':
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError:
+            raise ValueError("для FSM_STORAGE=redis установите пакет redis: pip install redis")
+        return RedisStorage.from_url(redis_url, state_ttl=int(ttl), data_ttl=int(ttl))
+    raise ValueError(f"неизвестное FSM-хранилище '{backend}' (memory, sqlite, redis)")
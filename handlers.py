@@ -1,24 +1,50 @@
 import os
-import csv
-import string
+import uuid
+import asyncio
 from datetime import datetime
 from dotenv import load_dotenv
 
-from aiogram import Router, html, F, types
+from aiogram import Bot, Router, html, F, types
 from aiogram.types import Message, CallbackQuery
-from aiogram.filters import CommandStart, StateFilter
+from aiogram.filters import Command, CommandStart, StateFilter
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 
-from logger import Logger
+from config import (
+    INFERENCE_BATCH_SIZE, INFERENCE_BATCH_DELAY_MS,
+    INFERENCE_WORKERS, INFERENCE_MAX_PENDING, INFERENCE_TIMEOUT, INFERENCE_BACKEND,
+    MODEL_WATCH_INTERVAL, MODEL_READY_WAIT, PREDICTION_CACHE_SIZE, STORAGE_BACKEND, SQLITE_PATH,
+    LOG_FLUSH_BATCH_SIZE, LOG_FLUSH_INTERVAL, METRICS_HOST, METRICS_PORT,
+    ADMIN_RATE_PER_SECOND, ADMIN_BURST,
+)
+from storage import create_storage
+from log_writer import AsyncLogWriter
+from admin_notifier import AdminNotifier
+from metrics import (REGISTRY, PROFILER, MetricsMiddleware, stage_timer,
+                     start_metrics_server, monitor_loop_lag)
 from ai.predictor import XPAnalyst
+from ai.preprocessing import clean_text
+from ai.batcher import InferenceBatcher
 
 # --- ИНИЦИАЛИЗАЦИЯ ---
 load_dotenv()
-analyst = XPAnalyst()
+# Модель (и TensorFlow) грузится в фоне после старта polling, см. on_startup
+analyst = XPAnalyst(
+    max_workers=INFERENCE_WORKERS,
+    max_pending=INFERENCE_MAX_PENDING,
+    timeout=INFERENCE_TIMEOUT,
+    backend=INFERENCE_BACKEND,
+    cache_size=PREDICTION_CACHE_SIZE,
+    lazy=True,
+)
+batcher = InferenceBatcher(analyst, INFERENCE_BATCH_SIZE, INFERENCE_BATCH_DELAY_MS)
 router = Router()
-logger = Logger()
+# Счетчик и время обработки каждого хендлера
+router.message.middleware(MetricsMiddleware())
+router.callback_query.middleware(MetricsMiddleware())
+# Хендлеры пишут логи через фоновый writer, файловый I/O не блокирует event loop
+logger = AsyncLogWriter(create_storage(STORAGE_BACKEND, SQLITE_PATH), LOG_FLUSH_BATCH_SIZE, LOG_FLUSH_INTERVAL)
 
 # Получаем ID админа из .env (обязательно числом)
 try:
@@ -27,6 +53,9 @@ except (TypeError, ValueError):
     ADMIN_ID = None
     print("Ошибка: ADMINS_TELEGRAM_ID не найден в .env или имеет неверный формат")
 
+# Отчеты админу: ограничение частоты, дайджесты и слияние отправки с правкой
+admin_notifier = AdminNotifier(ADMIN_ID, ADMIN_RATE_PER_SECOND, ADMIN_BURST)
+
 
 # --- 1. СОСТОЯНИЯ (FSM) ---
 class FeedbackStates(StatesGroup):
@@ -35,15 +64,6 @@ class FeedbackStates(StatesGroup):
 
 # --- 2. ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ---
 
-def clean_text(text: str) -> str:
-    """Очистка для нейросети (нижний регистр, без знаков препинания)."""
-    if not text:
-        return ""
-    text = text.lower()
-    text = text.translate(str.maketrans('', '', string.punctuation))
-    return " ".join(text.split())
-
-
 def extract_action_text(message_text: str):
     """Извлекает оригинальный текст действия из сообщения бота."""
     for line in message_text.split('\n'):
@@ -53,19 +73,56 @@ def extract_action_text(message_text: str):
 
 
 def log_user_feedback(text, complexity, status):
-    """Запись в датасеты ai/dataset/."""
-    text = clean_text(text)
-    filename = "good_user_dataset.csv" if status == "good" else "bad_user_dataset.csv"
-    folder_path = os.path.join("ai", "dataset")
-    os.makedirs(folder_path, exist_ok=True)
-    filepath = os.path.join(folder_path, filename)
+    """Запись оценки пользователя (good/bad) в хранилище."""
+    logger.log_feedback(clean_text(text), complexity, status)
+
+
+def inference_collector():
+    """Очереди, кэш и состояние модели: читаются при каждом запросе /metrics."""
+    stats = analyst.cache.stats()
+    return [
+        ("xp_model_ready", "gauge", "Модель загружена и отвечает", int(analyst.is_ready)),
+        ("xp_batcher_queue_depth", "gauge", "Тексты, ждущие сборки в батч", batcher.queue_size()),
+        ("xp_inference_pending", "gauge", "Батчи в пуле инференса", analyst.pending()),
+        ("xp_cache_hits_total", "counter", "Попадания в кэш предсказаний", stats["hits"]),
+        ("xp_cache_misses_total", "counter", "Промахи кэша предсказаний", stats["misses"]),
+        ("xp_cache_evictions_total", "counter", "Вытеснения из кэша предсказаний", stats["evictions"]),
+        ("xp_cache_size", "gauge", "Записей в кэше предсказаний", stats["size"]),
+        ("log_writer_queue_depth", "gauge", "Записи логов, ждущие сброса на диск", logger.queue_size()),
+        ("admin_queue_depth", "gauge", "Сообщения и правки админу в очереди", admin_notifier.queue_size()),
+    ]
+
+
+REGISTRY.add_collector(inference_collector)
+# Сервер /metrics и замер задержки event loop (создаются в on_startup)
+_metrics_runner = None
+_loop_lag_task = None
+
+
+async def on_startup(bot: Bot):
+    """Запускает фоновую загрузку модели, слежение за ее файлами, очередь админа и метрики."""
+    global _metrics_runner, _loop_lag_task
+    admin_notifier.start(bot)
+    analyst.start_loading()
+    analyst.start_watching(MODEL_WATCH_INTERVAL)
+    _loop_lag_task = asyncio.create_task(monitor_loop_lag())
+    if METRICS_PORT:
+        try:
+            _metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            print(f"❌ Не удалось запустить /metrics на {METRICS_HOST}:{METRICS_PORT}: {e}")
 
-    file_exists = os.path.isfile(filepath)
-    with open(filepath, mode='a', encoding='utf-16', newline='') as f:
-        writer = csv.writer(f, delimiter=';')
-        if not file_exists or os.path.getsize(filepath) == 0:
-            writer.writerow(['text', 'complexity'])
-        writer.writerow([text, complexity])
+
+async def on_shutdown():
+    """Останавливает фоновые задачи инференса и метрик и дописывает логи на диск."""
+    if _loop_lag_task is not None:
+        _loop_lag_task.cancel()
+    if _metrics_runner is not None:
+        await _metrics_runner.cleanup()
+    await batcher.close()
+    analyst.close()
+    await admin_notifier.close()
+    await logger.close()
 
 
 def get_confirm_keyboard(complexity):
@@ -85,6 +142,77 @@ async def command_start_handler(message: Message):
     await message.answer(f"Привет, {html.bold(message.from_user.full_name)}! Отправь мне описание действия.")
 
 
+@router.message(Command("cache_stats"))
+async def cache_stats_handler(message: Message):
+    """Счетчики кэша предсказаний (только для админа)."""
+    if message.from_user.id != ADMIN_ID:
+        return
+    stats = analyst.cache.stats()
+    await message.answer(
+        f"🗄 Кэш предсказаний: {stats['size']}/{stats['max_size']}\n"
+        f"Попадания: {stats['hits']} | Промахи: {stats['misses']} | Вытеснения: {stats['evictions']}\n"
+        f"Hit rate: {stats['hit_rate']:.1%}"
+    )
+
+
+@router.message(Command("reload"))
+async def reload_model_handler(message: Message):
+    """Перезагрузка модели с диска без рестарта бота (только для админа)."""
+    if message.from_user.id != ADMIN_ID:
+        return
+    try:
+        await analyst.areload(force=True)
+    except Exception as e:
+        await message.answer(f"❌ Новая версия не загрузилась, работает прежняя: {e}")
+        return
+    info = analyst.model_info()
+    await message.answer(f"🔄 Модель перезагружена: {info['active']}\nОткат: /rollback")
+
+
+@router.message(Command("rollback"))
+async def rollback_model_handler(message: Message):
+    """Возврат к предыдущей версии модели (только для админа)."""
+    if message.from_user.id != ADMIN_ID:
+        return
+    if await analyst.arollback():
+        await message.answer(f"↩️ Работает версия от {analyst.model_info()['active']}")
+    else:
+        await message.answer("Предыдущей версии нет.")
+
+
+@router.message(Command("model_info"))
+async def model_info_handler(message: Message):
+    """Какая версия модели сейчас работает (только для админа)."""
+    if message.from_user.id != ADMIN_ID:
+        return
+    info = analyst.model_info()
+    status = info['status']
+    if info['load_seconds'] is not None:
+        status += f" (загрузка {info['load_seconds']:.1f} с)"
+    if info['error']:
+        status += f": {info['error']}"
+    await message.answer(
+        f"🧠 Бэкенд: {info['backend']} | {info['model_path']}\n"
+        f"Статус: {status}\n"
+        f"Текущая версия: {info['active']}\n"
+        f"Предыдущая: {info['previous'] or '—'}\n"
+        f"Файл на диске новее: {'да' if info['on_disk_changed'] else 'нет'}"
+    )
+
+
+@router.message(Command("profile"))
+async def profile_handler(message: Message):
+    """Включение/выключение cProfile на лету (только для админа)."""
+    if message.from_user.id != ADMIN_ID:
+        return
+    if PROFILER.start():
+        await message.answer("🔬 Профилирование включено. Повторите /profile, чтобы остановить.")
+        return
+    path, report = PROFILER.stop(top=15)
+    # Лимит сообщения Telegram — 4096 символов
+    await message.answer(f"🔬 Профиль сохранен: {path}\n<pre>{html.quote(report[:3500])}</pre>")
+
+
 # А) Хэндлер для кнопки "Согласен"
 @router.callback_query(F.data.startswith("confirm_ok:"))
 async def process_ok_rating(callback_query: CallbackQuery, state: FSMContext):
@@ -94,16 +222,12 @@ async def process_ok_rating(callback_query: CallbackQuery, state: FSMContext):
 
     # Редактируем отчет у админа
     data = await state.get_data()
-    report_id = data.get("admin_report_id")
-    if report_id and ADMIN_ID:
-        try:
-            await callback_query.bot.edit_message_text(
-                chat_id=ADMIN_ID,
-                message_id=report_id,
-                text=f"✅ {user_tag} подтвердил оценку.\nТекст: \"{original_action}\"\nСложность: {current_complexity}"
-            )
-        except Exception:
-            pass
+    report_key = data.get("admin_report_key")
+    if report_key:
+        admin_notifier.edit(
+            report_key,
+            f"✅ {user_tag} подтвердил оценку.\nТекст: \"{original_action}\"\nСложность: {current_complexity}"
+        )
 
     log_user_feedback(original_action, current_complexity, "good")
     await state.clear()
@@ -141,22 +265,18 @@ async def manual_complexity_input(message: Message, state: FSMContext):
         if 0 <= new_val <= 10:
             data = await state.get_data()
             original_text = data.get("wrong_text")
-            report_id = data.get("admin_report_id")
+            report_key = data.get("admin_report_key")
 
             # Обновляем все логи
             log_user_feedback(original_text, new_val, "bad")
-            logger.update_complexity(message.from_user.id, new_val)
+            logger.update_complexity(message.from_user.id, new_val, data.get("log_record"))
 
             # Редактируем отчет админа
-            if report_id and ADMIN_ID:
-                try:
-                    await message.bot.edit_message_text(
-                        chat_id=ADMIN_ID,
-                        message_id=report_id,
-                        text=f"⚠️ {user_tag} ИСПРАВИЛ оценку\nТекст: \"{original_text}\"\nНовая сложность: {new_val}"
-                    )
-                except Exception:
-                    pass
+            if report_key:
+                admin_notifier.edit(
+                    report_key,
+                    f"⚠️ {user_tag} ИСПРАВИЛ оценку\nТекст: \"{original_text}\"\nНовая сложность: {new_val}"
+                )
 
             await message.answer(f"✅ Готово! Оценка {new_val} сохранена.\n Давай оценим новую активность!")
             await state.clear()
@@ -172,33 +292,38 @@ async def send_answer(message: Message, state: FSMContext):
     if not message.text or message.text.startswith('/'):
         return
 
+    # Сразу после старта модель еще грузится: короткое ожидание, затем просим повторить
+    if not await analyst.wait_ready(MODEL_READY_WAIT):
+        if analyst.status == "loading":
+            await message.answer("⏳ Нейросеть еще запускается, пришли действие через полминуты.")
+        else:
+            await message.answer("Не удалось оценить действие.")
+        return
+
     user_action = clean_text(message.text)
     user_tag = f"@{message.from_user.username}" if message.from_user.username else message.from_user.full_name
 
     try:
-        result = analyst.analyze(user_action)
+        with stage_timer("inference"):
+            result = await batcher.submit(user_action)
         if result:
             comp = result['complexity']
 
-            # Пишем в общий лог
+            # Пишем в общий лог. record — постоянный id строки: исправление найдет
+            # ее, даже если его примет другой процесс бота (общее FSM-хранилище)
+            record_id = uuid.uuid4().hex
             logger.log(
                 message.from_user.id,
                 user_tag,
                 message.text,
                 comp,
-                datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+                datetime.now().strftime("%d.%m.%Y %H:%M:%S"),
+                record_id
             )
 
-            # Отправляем отчет админу
-            if ADMIN_ID:
-                try:
-                    admin_msg = await message.bot.send_message(
-                        chat_id=ADMIN_ID,
-                        text=f"🔔 {user_tag} оценивает:\n\"{message.text}\"\nОценка: {comp}"
-                    )
-                    await state.update_data(admin_report_id=admin_msg.message_id)
-                except Exception as e:
-                    print(f"Ошибка отправки админу: {e}")
+            # Отчет админу уходит через очередь: ответ пользователю его не ждет
+            report_key = admin_notifier.send(f"🔔 {user_tag} оценивает:\n\"{message.text}\"\nОценка: {comp}")
+            await state.update_data(admin_report_key=report_key, log_record=record_id)
 
             await message.answer(
                 f"📊 Сложность действия: **{comp}**\n\n"
@@ -210,5 +335,7 @@ async def send_answer(message: Message, state: FSMContext):
             )
         else:
             await message.answer("Не удалось оценить действие.")
+    except asyncio.TimeoutError:
+        await message.answer("⏳ Сейчас много запросов, попробуй еще раз через минуту.")
     except Exception as e:
         await message.answer(f"Ошибка: {e}")
\ No newline at end of file
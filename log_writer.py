@@ -0,0 +1,95 @@
+import asyncio
+
+from metrics import stage_timer
+
+# Метка остановки фонового воркера
+_STOP = object()
+
+
+class AsyncLogWriter:
+    """Фоновая запись логов вне обработчиков.
+
+    Хендлеры только кладут записи в asyncio.Queue (методы с тем же
+    интерфейсом, что у Logger/SQLiteStorage), а фоновая задача забирает их
+    пачками — по batch_size записей или раз в flush_interval секунд — и
+    пишет одним вызовом storage.write_batch в отдельном потоке.
+    Порядок записей сохраняется: исправление всегда идет после своего лога.
+    """
+
+    def __init__(self, storage, batch_size: int = 100, flush_interval: float = 1.0):
+        self.storage = storage
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._queue = None
+        self._worker = None
+
+    # --- Интерфейс хранилища (не блокирует event loop) ---
+
+    def log(self, user_id: int, username: str, message: str, complexity: float, dt_string: str,
+            record_id: str = None):
+        self._put(('log', (user_id, username, message, complexity, dt_string, record_id)))
+
+    def update_complexity(self, user_id: int, new_complexity: float, record_id: str = None):
+        self._put(('update_complexity', (user_id, new_complexity, record_id)))
+
+    def log_feedback(self, text: str, complexity, status: str):
+        self._put(('log_feedback', (text, complexity, status)))
+
+    def queue_size(self):
+        """Записи, ждущие сброса на диск (для метрик)."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _put(self, record):
+        # Очередь и воркер создаются внутри работающего event loop
+        if self._worker is None or self._worker.done():
+            self._queue = self._queue or asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        self._queue.put_nowait(record)
+
+    # --- Фоновая запись ---
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = loop.time() + self.flush_interval
+            stop = False
+
+            while len(batch) < self.batch_size:
+                if not self._queue.empty():
+                    record = self._queue.get_nowait()
+                else:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        record = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if record is _STOP:
+                    stop = True
+                    break
+                batch.append(record)
+
+            await self._write(batch)
+            if stop:
+                return
+
+    async def _write(self, batch):
+        try:
+            with stage_timer("storage_write"):
+                await asyncio.to_thread(self.storage.write_batch, batch)
+        except Exception as e:
+            print(f"Ошибка записи логов ({len(batch)} записей): {e}")
+
+    async def close(self):
+        """Дописывает всю очередь, останавливает воркер и закрывает хранилище (fsync)."""
+        if self._worker is not None and not self._worker.done():
+            # Стоп-метка встает в конец очереди: всё, что было до нее, будет записано
+            self._queue.put_nowait(_STOP)
+            await self._worker
+        self._worker = None
+        await asyncio.to_thread(self.storage.close)
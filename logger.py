@@ -1,54 +1,213 @@
 import os
+import io
 import csv
+import uuid
+import argparse
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: только блокировка внутри процесса
+    fcntl = None
 
 
 class Logger:
     # Путь к файлу логов
     LOG_FILE_PATH = os.path.join('logs', 'logs.csv')
+    # Исправления сложности дописываются сюда, а не переписывают logs.csv
+    CORRECTIONS_PATH = os.path.join('logs', 'corrections.csv')
+    # Блокировка (flock) для нескольких процессов бота, пишущих в одни файлы
+    LOCK_PATH = os.path.join('logs', 'logs.lock')
+
+    # Датасеты обратной связи пользователей (good/bad)
+    FEEDBACK_DIR = os.path.join('ai', 'dataset')
+
+    # record — постоянный id строки: по нему исправление находит свою запись
+    HEADER = ['id', 'username', 'message', 'complexity', 'datetime', 'record']
+    CORRECTIONS_HEADER = ['record', 'id', 'complexity']
+    FEEDBACK_HEADER = ['text', 'complexity']
 
     def __init__(self):
         # Создаем папку logs при инициализации, если её еще нет
         os.makedirs(os.path.dirname(self.LOG_FILE_PATH), exist_ok=True)
+        self._lock = threading.Lock()
+        # Последняя запись пользователя, сделанная этим процессом (если record не передан)
+        self._last_record = {}
+        # Файлы, которые нужно сбросить на диск при закрытии
+        self._touched = set()
+        self._upgrade_legacy()
 
-    def log(self, user_id: int, username: str, message: str, complexity: float, dt_string: str):
-        """Записывает данные в CSV файл."""
+    @contextmanager
+    def _file_lock(self):
+        """Блокировка внутри процесса и между процессами (дозапись, compact)."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.LOCK_PATH, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
 
-        # Проверяем, нужно ли писать заголовок (файл не существует или пустой)
-        file_not_exist = not os.path.exists(self.LOG_FILE_PATH) or os.path.getsize(self.LOG_FILE_PATH) == 0
+    def _upgrade_legacy(self):
+        """Лог старого формата (без колонки record, исправления по номеру строки) собирается заново.
+
+        Номера строк были верны, пока в лог писал один процесс, поэтому
+        старые исправления применяются до перехода на record.
+        """
+        if not os.path.exists(self.LOG_FILE_PATH):
+            return
+        with open(self.LOG_FILE_PATH, mode='r', encoding='utf-16', newline='') as f:
+            header = next(csv.reader(f, delimiter=';'), None)
+        if header and 'record' not in header:
+            self.compact()
+
+    @staticmethod
+    def _append(path, header, rows):
+        """Дописывает строки одним write(), заголовок — только в пустой файл."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=';')
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            writer.writerow(header)
+        writer.writerows(rows)
 
         # Используем utf-16, как и в твоих датасетах
-        with open(self.LOG_FILE_PATH, mode='a', encoding='utf-16', newline='') as f:
-            writer = csv.writer(f, delimiter=';')
+        with open(path, mode='a', encoding='utf-16', newline='') as f:
+            f.write(buffer.getvalue())
+            f.flush()
+
+    def log(self, user_id: int, username: str, message: str, complexity: float, dt_string: str,
+            record_id: str = None):
+        """Записывает данные в CSV файл. record_id — постоянный id строки (uuid)."""
+        self.write_batch([('log', (user_id, username, message, complexity, dt_string, record_id))])
+
+    def update_complexity(self, user_id: int, new_complexity: float, record_id: str = None):
+        """Исправляет сложность записи record_id (без него — последней записи пользователя в этом процессе).
+
+        Вместо перезаписи logs.csv дописывает запись в corrections.csv — O(1)
+        на исправление. Итоговый CSV собирает compact().
+        """
+        self.write_batch([('update_complexity', (user_id, new_complexity, record_id))])
+
+    def log_feedback(self, text: str, complexity, status: str):
+        """Запись оценки пользователя в ai/dataset/{good,bad}_user_dataset.csv."""
+        self.write_batch([('log_feedback', (text, complexity, status))])
+
+    def write_batch(self, records):
+        """Пачка записей ('метод', аргументы) — по одному write() на каждый файл."""
+        appends = {}
 
-            if file_not_exist:
-                writer.writerow(['id', 'username', 'message', 'complexity', 'datetime'])
+        def rows_for(path, header):
+            return appends.setdefault(path, (header, []))[1]
 
-            writer.writerow([user_id, username, message, complexity, dt_string])
+        with self._file_lock():
+            for method, args in records:
+                if method == 'log':
+                    user_id, username, message, complexity, dt_string, record_id = args
+                    record_id = record_id or uuid.uuid4().hex
+                    rows_for(self.LOG_FILE_PATH, self.HEADER).append(
+                        [user_id, username, message, complexity, dt_string, record_id])
+                    self._last_record[str(user_id)] = record_id
+                elif method == 'update_complexity':
+                    user_id, new_complexity, record_id = args
+                    record_id = record_id or self._last_record.get(str(user_id))
+                    if record_id is not None:
+                        rows_for(self.CORRECTIONS_PATH, self.CORRECTIONS_HEADER).append(
+                            [record_id, user_id, new_complexity])
+                elif method == 'log_feedback':
+                    text, complexity, status = args
+                    filename = "good_user_dataset.csv" if status == "good" else "bad_user_dataset.csv"
+                    os.makedirs(self.FEEDBACK_DIR, exist_ok=True)
+                    rows_for(os.path.join(self.FEEDBACK_DIR, filename), self.FEEDBACK_HEADER).append(
+                        [text, complexity])
+                else:
+                    raise ValueError(f"неизвестная операция логгера '{method}'")
 
-    def update_complexity(self, user_id: int, new_complexity: float):
-        """Ищет последнюю запись пользователя в логах и меняет сложность."""
+            for path, (header, rows) in appends.items():
+                self._append(path, header, rows)
+                self._touched.add(path)
+
+    def flush(self):
+        """CSV пишется сразу, буферов нет."""
+
+    def close(self):
+        """Сбрасывает на диск (fsync) все файлы, в которые писал логгер."""
+        with self._lock:
+            for path in self._touched:
+                if os.path.exists(path):
+                    fd = os.open(path, os.O_RDWR)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+            self._touched.clear()
+
+    def iter_merged_rows(self):
+        """Строки logs.csv (без заголовка) с примененными исправлениями."""
         if not os.path.exists(self.LOG_FILE_PATH):
             return
 
-        rows = []
-        updated = False
-
-        # Читаем все данные
-        with open(self.LOG_FILE_PATH, mode='r', encoding='utf-16') as f:
-            reader = list(csv.reader(f, delimiter=';'))
-            if not reader: return
-            header = reader[0]
-            data = reader[1:]
-
-        # Ищем последнюю запись этого пользователя (идем с конца)
-        for i in range(len(data) - 1, -1, -1):
-            # data[i][0] — это id пользователя в твоем логгере
-            if str(data[i][0]) == str(user_id) and not updated:
-                data[i][3] = str(new_complexity)  # 3 — индекс колонки complexity
-                updated = True
-
-        # Перезаписываем файл
-        with open(self.LOG_FILE_PATH, mode='w', encoding='utf-16', newline='') as f:
-            writer = csv.writer(f, delimiter=';')
-            writer.writerow(header)
-            writer.writerows(data)
\ No newline at end of file
+        # Исправления по record и (старый формат row;id;complexity) по номеру строки
+        corrections, legacy = {}, {}
+        if os.path.exists(self.CORRECTIONS_PATH):
+            with open(self.CORRECTIONS_PATH, mode='r', encoding='utf-16', newline='') as f:
+                reader = csv.reader(f, delimiter=';')
+                header = next(reader, None)
+                target = legacy if header and header[0] == 'row' else corrections
+                for row in reader:
+                    if row:
+                        # Более позднее исправление той же строки побеждает
+                        target[int(row[0]) if target is legacy else row[0]] = row[2]
+
+        with open(self.LOG_FILE_PATH, mode='r', encoding='utf-16', newline='') as f:
+            reader = csv.reader(f, delimiter=';')
+            next(reader, None)
+            for row_number, row in enumerate(reader):
+                if not row:
+                    continue
+                # Строки старого формата без record
+                row += [''] * (len(self.HEADER) - len(row))
+                correction = corrections.get(row[5]) if row[5] else legacy.get(row_number)
+                if correction is not None:
+                    row[3] = correction  # 3 — индекс колонки complexity
+                yield row
+
+    def compact(self, output_path=None):
+        """Применяет исправления к логу и атомарно записывает объединенный CSV.
+
+        Без output_path лог заменяется объединенной версией, а файл
+        исправлений очищается. Другие процессы бота на это время ждут
+        блокировку, поэтому их записи не теряются между чтением и заменой.
+        """
+        with self._file_lock():
+            if not os.path.exists(self.LOG_FILE_PATH):
+                return None
+
+            target = output_path or self.LOG_FILE_PATH
+            tmp_path = f"{target}.tmp"
+            with open(tmp_path, mode='w', encoding='utf-16', newline='') as dst:
+                writer = csv.writer(dst, delimiter=';')
+                writer.writerow(self.HEADER)
+                writer.writerows(self.iter_merged_rows())
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(tmp_path, target)
+
+            if output_path is None and os.path.exists(self.CORRECTIONS_PATH):
+                os.remove(self.CORRECTIONS_PATH)
+            return target
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Обслуживание логов бота")
+    parser.add_argument("command", choices=["compact"],
+                        help="compact — применить исправления к logs.csv")
+    parser.add_argument("--output", default=None,
+                        help="куда записать объединенный CSV (по умолчанию заменить logs.csv)")
+    args = parser.parse_args()
+
+    path = Logger().compact(args.output)
+    print(f"✅ Объединенный лог: {path}" if path else "Лог пуст, нечего объединять.")
@@ -1,26 +1,65 @@
+import time
+
+# Отсчет времени старта до импорта тяжелых модулей
+PROCESS_START = time.perf_counter()
+
 import asyncio
 import logging
 import sys
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 
 # Импортируем настройки и роутеры
-from config import BOT_TOKEN
-from handlers import router
+from config import (
+    BOT_TOKEN, FSM_STORAGE, FSM_SQLITE_PATH, REDIS_URL, FSM_TTL, BOT_MODE, TELEGRAM_API_URL,
+    WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET,
+    WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE, WEBHOOK_DRAIN_TIMEOUT,
+)
+from fsm_storage import create_fsm_storage
+from webhook import WebhookServer
+from handlers import router, on_startup, on_shutdown
+
+IMPORT_SECONDS = time.perf_counter() - PROCESS_START
+
+
+async def report_startup():
+    """Время импорта и старта до приема апдейтов (модель в этот момент еще грузится в фоне)."""
+    print(f"⏱ Импорт модулей: {IMPORT_SECONDS:.2f} с | до приема апдейтов: "
+          f"{time.perf_counter() - PROCESS_START:.2f} с")
+
 
 async def main():
     # Настраиваем бота
-    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    dp = Dispatcher()
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+    bot = Bot(token=BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    # FSM-состояния в SQLite/Redis переживают рестарт и общие для нескольких процессов
+    storage = create_fsm_storage(FSM_STORAGE, FSM_SQLITE_PATH, REDIS_URL, FSM_TTL)
+    isolation = storage.create_isolation() if hasattr(storage, "create_isolation") else None
+    dp = Dispatcher(storage=storage, events_isolation=isolation)
 
     # САМОЕ ВАЖНОЕ: подключаем наш роутер к главному диспетчеру
     dp.include_router(router)
+    dp.startup.register(on_startup)
+    dp.startup.register(report_startup)
+    dp.shutdown.register(on_shutdown)
 
     # Запускаем логирование и бота
     logging.basicConfig(level=logging.INFO, stream=sys.stdout)
-    await dp.start_polling(bot)
+    # FSM-хранилище закрывает сам Dispatcher при shutdown
+    if BOT_MODE == "webhook":
+        server = WebhookServer(dp, bot, WEBHOOK_PATH, WEBHOOK_SECRET,
+                               WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE, WEBHOOK_DRAIN_TIMEOUT)
+        await server.run(WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_URL)
+    else:
+        await dp.start_polling(bot)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        # Без обработчиков сигналов (Windows) Ctrl+C доходит сюда уже после остановки бота
+        pass
\ No newline at end of file
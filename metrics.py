@@ -0,0 +1,290 @@
+import io
+import os
+import time
+import bisect
+import pstats
+import asyncio
+import cProfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+# Границы бакетов гистограмм латентности (сек)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Как часто замеряется задержка event loop (сек)
+LOOP_LAG_INTERVAL = 0.5
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Монотонный счетчик с метками (формат Prometheus)."""
+    type = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self.labels, key, value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    """Значение, которое может уменьшаться."""
+    type = "gauge"
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram:
+    """Гистограмма с кумулятивными бакетами, суммой и числом наблюдений."""
+    type = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            counts, total = self._values.get(label_values, ([0] * len(self.buckets), 0.0))
+            # Первый бакет с границей >= value (последний — +Inf)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[label_values] = (counts, total + value)
+
+    def samples(self):
+        result = []
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                result.append((f"{self.name}_bucket", self.labels + ("le",), key + (_format_value(bound),), cumulative))
+            result.append((f"{self.name}_sum", self.labels, key, total))
+            result.append((f"{self.name}_count", self.labels, key, cumulative))
+        return result
+
+
+class Registry:
+    """Набор метрик и коллекторов, которые опрашиваются при каждом запросе /metrics."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def add_collector(self, collector):
+        """collector() -> [(имя, тип, описание, значение)] — значения, которые дешевле прочитать при опросе."""
+        self._collectors.append(collector)
+
+    def render(self):
+        """Текстовый формат экспозиции Prometheus 0.0.4."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, label_names, label_values, value in metric.samples():
+                lines.append(f"{name}{_format_labels(label_names, label_values)} {_format_value(value)}")
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception as e:
+                print(f"Ошибка сбора метрик: {e}")
+                continue
+            for name, metric_type, help_text, value in samples:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# --- МЕТРИКИ БОТА ---
+REGISTRY = Registry()
+UPDATES = REGISTRY.counter("bot_updates_total", "Обработанные апдейты по хендлерам", ("handler",))
+UPDATE_SECONDS = REGISTRY.histogram("bot_update_seconds", "Время обработки апдейта", ("handler",))
+STAGE_SECONDS = REGISTRY.histogram("bot_stage_seconds", "Время этапов обработки", ("stage",))
+ERRORS = REGISTRY.counter("bot_errors_total", "Ошибки по этапам", ("stage",))
+LOOP_LAG = REGISTRY.histogram("bot_event_loop_lag_seconds", "Задержка event loop сверх ожидаемой")
+STARTED_AT = time.time()
+
+
+@contextmanager
+def stage_timer(stage):
+    """Время этапа (inference, admin_send, storage_write...) в bot_stage_seconds, исключения — в bot_errors_total.
+
+    Работает и вокруг await: замеряется время от входа до выхода из блока.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.inc(stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Счетчик и время обработки апдейтов по именам хендлеров (inner middleware роутера)."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", type(event).__name__)
+        UPDATES.inc(name)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            ERRORS.inc(f"handler:{name}")
+            raise
+        finally:
+            UPDATE_SECONDS.observe(time.perf_counter() - start, name)
+
+
+def process_collector():
+    """RSS, время работы и PID (для py-spy dump/record --pid)."""
+    with open('/proc/self/statm') as f:
+        rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    return [
+        ("process_resident_memory_bytes", "gauge", "RSS процесса", rss),
+        ("process_uptime_seconds", "gauge", "Время работы", round(time.time() - STARTED_AT, 1)),
+        ("process_pid", "gauge", "PID для py-spy", os.getpid()),
+        ("process_threads", "gauge", "Число потоков", threading.active_count()),
+    ]
+
+
+async def monitor_loop_lag(interval=LOOP_LAG_INTERVAL):
+    """Замер задержки event loop: насколько sleep(interval) просыпается позже срока."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - start - interval))
+
+
+# --- ПРОФИЛИРОВАНИЕ ---
+
+class Profiler:
+    """cProfile, включаемый и выключаемый на лету (админ-командой или через HTTP).
+
+    Профилирует поток event loop, где он был включен: потоки пула
+    инференса удобнее смотреть снаружи через `py-spy top --pid <process_pid>`.
+    """
+
+    def __init__(self, output_dir=os.path.join("logs", "profiles")):
+        self.output_dir = output_dir
+        self._profile = None
+        self._started = None
+
+    @property
+    def running(self):
+        return self._profile is not None
+
+    def start(self):
+        if self.running:
+            return False
+        self._profile = cProfile.Profile()
+        self._started = time.time()
+        self._profile.enable()
+        return True
+
+    def stop(self, top=20):
+        """Останавливает профилирование, сохраняет .pstats и возвращает (путь, топ функций)."""
+        if not self.running:
+            return None, ""
+        self._profile.disable()
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, time.strftime("profile-%Y%m%d-%H%M%S.pstats"))
+        self._profile.dump_stats(path)
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=stream)
+        stats.sort_stats("cumulative").print_stats(top)
+        self._profile = None
+        return path, stream.getvalue()
+
+
+PROFILER = Profiler()
+
+
+# --- HTTP /metrics ---
+
+def create_app(registry=REGISTRY, profiler=PROFILER):
+    """GET /metrics, POST /profile/start и /profile/stop."""
+
+    async def metrics_handler(request):
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    async def profile_start(request):
+        started = profiler.start()
+        return web.Response(text="started\n" if started else "already running\n")
+
+    async def profile_stop(request):
+        path, report = profiler.stop(int(request.query.get("top", 20)))
+        if path is None:
+            return web.Response(text="not running\n", status=409)
+        return web.Response(text=f"{path}\n{report}")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    app.router.add_post("/profile/start", profile_start)
+    app.router.add_post("/profile/stop", profile_stop)
+    return app
+
+
+async def start_metrics_server(host, port, registry=REGISTRY):
+    """Запускает /metrics в том же event loop, что и бот. Возвращает runner для остановки."""
+    registry.add_collector(process_collector)
+    runner = web.AppRunner(create_app(registry))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"📈 Метрики: http://{host}:{port}/metrics")
+    return runner
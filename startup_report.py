@@ -0,0 +1,111 @@
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+# Модули, которые не должны импортироваться при старте бота (грузятся в фоне)
+FORBIDDEN_MODULES = ["tensorflow", "keras"]
+
+# Строка вывода python -X importtime: "import time: self | cumulative | name"
+_IMPORT_LINE_RE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+# Подпроцесс: время загрузки модели XPAnalyst "с нуля" (импорт TensorFlow + прогрев)
+_MODEL_SNIPPET = """
+import json, time
+started = time.perf_counter()
+from ai.predictor import XPAnalyst
+analyst = XPAnalyst(backend={backend!r})
+print(json.dumps({{"ready": analyst.is_ready, "seconds": time.perf_counter() - started,
+                  "load_seconds": analyst.load_seconds}}))
+"""
+
+
+def _env():
+    env = dict(os.environ)
+    # config.py завершает процесс без токена, для замера импорта подойдет любой
+    env.setdefault("TELEGRAM_BOT_TOKEN", "0:startup-report")
+    return env
+
+
+def measure_imports(module="handlers"):
+    """Замер `python -X importtime -c "import module"` в чистом процессе."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, env=_env(), cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode != 0:
+        raise RuntimeError(f"импорт {module} завершился с кодом {proc.returncode}:\n{proc.stderr[-2000:]}")
+
+    total_us, children, pending, imported = 0, [], [], set()
+    for line in proc.stderr.splitlines():
+        match = _IMPORT_LINE_RE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        imported.add(name.split('.')[0])
+        # Вложенные импорты печатаются до родителя: отступ 3 — прямые импорты
+        # модуля верхнего уровня (отступ 1), сумма верхнего уровня — время импорта
+        if indent == 3:
+            pending.append((name, cumulative / 1000))
+        elif indent == 1:
+            total_us += cumulative
+            if name == module:
+                children = pending
+            pending = []
+    return {
+        "module": module,
+        "total_ms": total_us / 1000,
+        "top": sorted(children, key=lambda item: -item[1]),
+        "forbidden": [name for name in FORBIDDEN_MODULES if name in imported],
+    }
+
+
+def measure_model(backend):
+    """Холодная загрузка модели в отдельном процессе."""
+    proc = subprocess.run([sys.executable, "-c", _MODEL_SNIPPET.format(backend=backend)],
+                          capture_output=True, text=True, env=_env(), cwd=os.path.dirname(os.path.abspath(__file__)))
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(f"загрузка модели завершилась с кодом {proc.returncode}:\n{proc.stderr[-2000:]}")
+    return json.loads(lines[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Время импорта и старта бота")
+    parser.add_argument("--module", default="handlers", help="модуль, импорт которого замеряется")
+    parser.add_argument("--top", type=int, default=10, help="сколько самых медленных импортов показать")
+    parser.add_argument("--budget-ms", type=float, default=0,
+                        help="код выхода 1, если импорт дольше (0 — не проверять)")
+    parser.add_argument("--model", metavar="BACKEND", help="дополнительно замерить загрузку модели (keras/numpy)")
+    parser.add_argument("--json", help="сохранить отчет в JSON")
+    args = parser.parse_args()
+
+    report = {"imports": measure_imports(args.module)}
+    imports = report["imports"]
+    print(f"⏱ Импорт {args.module}: {imports['total_ms']:.0f} мс")
+    for name, ms in imports["top"][:args.top]:
+        print(f"  {ms:8.0f} мс  {name}")
+
+    failed = False
+    if imports["forbidden"]:
+        print(f"❌ При импорте загружаются тяжелые модули: {', '.join(imports['forbidden'])}")
+        failed = True
+    if args.budget_ms and imports["total_ms"] > args.budget_ms:
+        print(f"❌ Импорт дольше бюджета: {imports['total_ms']:.0f} > {args.budget_ms:.0f} мс")
+        failed = True
+
+    if args.model:
+        report["model"] = measure_model(args.model)
+        model = report["model"]
+        if model["ready"]:
+            print(f"🧠 Модель ({args.model}): {model['seconds']:.2f} с с импортом, "
+                  f"из них загрузка и прогрев {model['load_seconds']:.2f} с")
+        else:
+            print(f"❌ Модель ({args.model}) не загрузилась")
+            failed = True
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📄 Отчет сохранен: {args.json}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,311 @@
+import os
+import csv
+import time
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+
+from logger import Logger
+
+# Формат даты в логах бота
+DATETIME_FORMAT = "%d.%m.%Y %H:%M:%S"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    username TEXT,
+    message TEXT,
+    complexity REAL,
+    corrected_complexity REAL,
+    datetime TEXT,
+    created_at REAL NOT NULL,
+    record TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_interactions_user ON interactions(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_interactions_created ON interactions(created_at);
+
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    text TEXT NOT NULL,
+    complexity REAL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_feedback_status_created ON feedback(status, created_at);
+
+CREATE TABLE IF NOT EXISTS corrections (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    interaction_id INTEGER NOT NULL REFERENCES interactions(id),
+    user_id INTEGER NOT NULL,
+    complexity REAL NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_corrections_user ON corrections(user_id, created_at);
+"""
+
+# Индекс по record создается после миграции старых баз (колонка добавлена позже)
+RECORD_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS idx_interactions_record ON interactions(record)"
+
+
+def _parse_datetime(dt_string):
+    """Строка даты бота -> unix time (для индекса по времени)."""
+    try:
+        return datetime.strptime(dt_string, DATETIME_FORMAT).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+class SQLiteStorage:
+    """Хранилище логов и обратной связи в SQLite (WAL).
+
+    Интерфейс совпадает с Logger: log, update_complexity, log_feedback,
+    write_batch, flush, close. Вставки копятся в памяти и пишутся пачкой, когда
+    набралось batch_size записей или прошло flush_interval секунд.
+    Одно соединение на процесс, доступ из потоков — под блокировкой.
+    """
+
+    DB_PATH = os.path.join('logs', 'bot.sqlite3')
+
+    def __init__(self, path=None, batch_size: int = 20, flush_interval: float = 1.0):
+        self.path = path or self.DB_PATH
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(interactions)")}
+        if 'record' not in columns:
+            self._conn.execute("ALTER TABLE interactions ADD COLUMN record TEXT")
+        self._conn.execute(RECORD_INDEX)
+        self._conn.commit()
+
+        self._pending_interactions = []
+        self._pending_feedback = []
+        self._last_flush = time.monotonic()
+
+    # --- Запись ---
+
+    def log(self, user_id: int, username: str, message: str, complexity: float, dt_string: str,
+            record_id: str = None):
+        with self._lock:
+            self._pending_interactions.append(
+                (user_id, username, message, complexity, dt_string, _parse_datetime(dt_string), record_id)
+            )
+            self._maybe_flush()
+
+    def log_feedback(self, text: str, complexity, status: str):
+        with self._lock:
+            self._pending_feedback.append((text, complexity, status, time.time()))
+            self._maybe_flush()
+
+    def update_complexity(self, user_id: int, new_complexity: float, record_id: str = None):
+        """Исправляет сложность записи record_id или последней записи пользователя (поиск по индексу)."""
+        with self._lock:
+            self._update_complexity_locked(user_id, new_complexity, record_id)
+
+    def write_batch(self, records):
+        """Пачка записей ('метод', аргументы) от AsyncLogWriter в порядке поступления."""
+        with self._lock:
+            for method, args in records:
+                if method == 'log':
+                    user_id, username, message, complexity, dt_string, record_id = args
+                    self._pending_interactions.append(
+                        (user_id, username, message, complexity, dt_string, _parse_datetime(dt_string), record_id)
+                    )
+                elif method == 'log_feedback':
+                    text, complexity, status = args
+                    self._pending_feedback.append((text, complexity, status, time.time()))
+                elif method == 'update_complexity':
+                    self._update_complexity_locked(*args)
+                else:
+                    raise ValueError(f"неизвестная операция хранилища '{method}'")
+            self._flush_locked()
+
+    def _update_complexity_locked(self, user_id, new_complexity, record_id=None):
+        # Последняя запись пользователя может еще лежать в буфере
+        self._flush_locked()
+        if record_id:
+            row = self._conn.execute("SELECT id FROM interactions WHERE record = ?", (record_id,)).fetchone()
+        else:
+            row = self._conn.execute(
+                "SELECT MAX(id) FROM interactions WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if not row or row[0] is None:
+            return
+        with self._conn:
+            self._conn.execute(
+                "UPDATE interactions SET corrected_complexity = ? WHERE id = ?",
+                (new_complexity, row[0]),
+            )
+            self._conn.execute(
+                "INSERT INTO corrections (interaction_id, user_id, complexity, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (row[0], user_id, new_complexity, time.time()),
+            )
+
+    def _maybe_flush(self):
+        pending = len(self._pending_interactions) + len(self._pending_feedback)
+        if pending >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._pending_interactions or self._pending_feedback:
+            # Одна транзакция на пачку
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO interactions (user_id, username, message, complexity, datetime, created_at, record) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    self._pending_interactions,
+                )
+                self._conn.executemany(
+                    "INSERT INTO feedback (text, complexity, status, created_at) VALUES (?, ?, ?, ?)",
+                    self._pending_feedback,
+                )
+            self._pending_interactions.clear()
+            self._pending_feedback.clear()
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._conn.close()
+
+    # --- Экспорт в прежний CSV формат ---
+
+    def export_csv(self, output_path=None):
+        """Выгрузка логов в формате logs.csv (с учетом исправлений)."""
+        output_path = output_path or os.path.join('logs', 'export.csv')
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, username, message, COALESCE(corrected_complexity, complexity), datetime, "
+                "COALESCE(record, '') FROM interactions ORDER BY id"
+            )
+            self._write_csv(output_path, Logger.HEADER, rows)
+        return output_path
+
+    def export_feedback_csv(self, status, output_path):
+        """Выгрузка good/bad оценок в формате *_user_dataset.csv."""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT text, complexity FROM feedback WHERE status = ? ORDER BY id", (status,)
+            )
+            self._write_csv(output_path, Logger.FEEDBACK_HEADER, rows)
+        return output_path
+
+    def read_feedback(self, after_id=0):
+        """Оценки good/bad с id больше after_id: [(id, текст, сложность)] по порядку (для дообучения)."""
+        self.flush()
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, text, complexity FROM feedback WHERE id > ? ORDER BY id", (after_id,)
+            ).fetchall()
+
+    @staticmethod
+    def _write_csv(path, header, rows):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, mode='w', encoding='utf-16', newline='') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(header)
+            writer.writerows(rows)
+        os.replace(tmp_path, path)
+
+    # --- Миграция из CSV ---
+
+    def has_data(self):
+        with self._lock:
+            return any(
+                self._conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+                for table in ('interactions', 'feedback')
+            )
+
+    def import_csv_logs(self, logger: Logger):
+        """Импорт logs.csv (с исправлениями из corrections.csv)."""
+        count = 0
+        with self._lock, self._conn:
+            for row in logger.iter_merged_rows():
+                if len(row) < 5:
+                    continue
+                user_id, username, message, complexity, dt_string, record_id = row[:6]
+                self._conn.execute(
+                    "INSERT INTO interactions (user_id, username, message, complexity, datetime, created_at, record) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (int(user_id), username, message, float(complexity), dt_string, _parse_datetime(dt_string),
+                     record_id or None),
+                )
+                count += 1
+        return count
+
+    def import_feedback_csv(self, path, status):
+        """Импорт good_user_dataset.csv / bad_user_dataset.csv."""
+        if not os.path.exists(path):
+            return 0
+        count = 0
+        imported_at = os.path.getmtime(path)
+        with open(path, mode='r', encoding='utf-16', newline='') as f, self._lock, self._conn:
+            reader = csv.reader(f, delimiter=';')
+            next(reader, None)
+            for row in reader:
+                if len(row) < 2:
+                    continue
+                self._conn.execute(
+                    "INSERT INTO feedback (text, complexity, status, created_at) VALUES (?, ?, ?, ?)",
+                    (row[0], float(row[1]), status, imported_at),
+                )
+                count += 1
+        return count
+
+
+def create_storage(backend: str = 'csv', sqlite_path=None):
+    """Хранилище логов по имени бэкенда: csv (Logger) или sqlite."""
+    if backend == 'sqlite':
+        return SQLiteStorage(sqlite_path)
+    if backend == 'csv':
+        return Logger()
+    raise ValueError(f"неизвестное хранилище '{backend}'")
+
+
+def migrate(db_path=None):
+    """Перенос logs.csv и датасетов обратной связи в SQLite."""
+    storage = SQLiteStorage(db_path)
+    if storage.has_data():
+        storage.close()
+        print(f"❌ База {storage.path} уже содержит данные, миграция не выполнена.")
+        return
+    interactions = storage.import_csv_logs(Logger())
+    good = storage.import_feedback_csv(os.path.join(Logger.FEEDBACK_DIR, 'good_user_dataset.csv'), 'good')
+    bad = storage.import_feedback_csv(os.path.join(Logger.FEEDBACK_DIR, 'bad_user_dataset.csv'), 'bad')
+    storage.close()
+    print(f"✅ Импортировано: логов {interactions}, good {good}, bad {bad} -> {storage.path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite хранилище логов бота")
+    parser.add_argument("command", choices=["migrate", "export"],
+                        help="migrate — импорт CSV в SQLite, export — выгрузка SQLite в CSV")
+    parser.add_argument("--db", default=None, help="путь к базе (по умолчанию logs/bot.sqlite3)")
+    parser.add_argument("--output-dir", default=os.path.join('logs', 'export'),
+                        help="куда выгрузить CSV при export")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate(args.db)
+    else:
+        storage = SQLiteStorage(args.db)
+        storage.export_csv(os.path.join(args.output_dir, 'logs.csv'))
+        for status in ('good', 'bad'):
+            storage.export_feedback_csv(status, os.path.join(args.output_dir, f'{status}_user_dataset.csv'))
+        storage.close()
+        print(f"✅ CSV выгружены в {args.output_dir}")
@@ -0,0 +1,144 @@
+import hmac
+import signal
+import asyncio
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from metrics import REGISTRY, ERRORS, STAGE_SECONDS
+
+# Заголовок, в котором Telegram присылает secret_token из setWebhook
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Прием апдейтов по HTTP (aiohttp) и обработка ограниченным пулом воркеров.
+
+    POST на path кладет апдейт в очередь и сразу отвечает 200, а workers
+    задач разбирают очередь через dp.feed_update. Если очередь заполнена
+    или идет остановка, ответ 503 — Telegram повторит доставку позже.
+    При остановке сервер перестает принимать апдейты и дожидается
+    обработки очереди (не дольше drain_timeout секунд).
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, path: str = "/webhook", secret: str = None,
+                 workers: int = 16, queue_size: int = 1000, drain_timeout: float = 30.0):
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret = secret
+        self.workers = max(1, workers)
+        self.drain_timeout = drain_timeout
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._workers = []
+        self._accepting = False
+        self.stats = {"accepted": 0, "rejected": 0, "processed": 0, "failed": 0}
+        REGISTRY.add_collector(self._collect)
+
+    def _collect(self):
+        return [
+            ("webhook_queue_depth", "gauge", "Апдейты, ждущие свободного воркера", self._queue.qsize()),
+            ("webhook_accepted_total", "counter", "Принятые апдейты", self.stats["accepted"]),
+            ("webhook_rejected_total", "counter", "Апдейты, отклоненные с 503", self.stats["rejected"]),
+        ]
+
+    # --- HTTP ---
+
+    async def handle(self, request: web.Request):
+        if self.secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        if not self._accepting:
+            return web.Response(status=503, text="shutting down")
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception:
+            return web.Response(status=400, text="bad update")
+        try:
+            self._queue.put_nowait((update, asyncio.get_running_loop().time()))
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            return web.Response(status=503, text="overloaded")
+        self.stats["accepted"] += 1
+        return web.Response(text="ok")
+
+    def create_app(self):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    # --- Пул воркеров ---
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            update, received = await self._queue.get()
+            STAGE_SECONDS.observe(loop.time() - received, "webhook_queue")
+            try:
+                await self.dp.feed_update(self.bot, update)
+                self.stats["processed"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                ERRORS.inc("webhook")
+                print(f"Ошибка обработки апдейта {update.update_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def start_workers(self):
+        self._accepting = True
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def drain(self):
+        """Перестает принимать апдейты, дожидается очереди и останавливает воркеры."""
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self._queue.join(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ За {self.drain_timeout} с не обработано апдейтов: {self._queue.qsize()}")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    # --- Запуск ---
+
+    async def run(self, host: str, port: int, webhook_url: str = None):
+        """Запускает сервер и работает до SIGINT/SIGTERM (на Windows — до Ctrl+C или отмены задачи).
+
+        webhook_url — публичный адрес для setWebhook; без него webhook не
+        регистрируется (локальная проверка, адрес задан заранее).
+        """
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                # Windows: обработчиков сигналов в event loop нет, Ctrl+C приходит
+                # отменой задачи (asyncio.run) или KeyboardInterrupt — остановка та же, в finally
+                break
+
+        workflow_data = {"dispatcher": self.dp, "bots": [self.bot], **self.dp.workflow_data}
+        await self.dp.emit_startup(bot=self.bot, **workflow_data)
+        self.start_workers()
+        runner = web.AppRunner(self.create_app())
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        if webhook_url:
+            await self.bot.set_webhook(webhook_url, secret_token=self.secret,
+                                       allowed_updates=self.dp.resolve_used_update_types())
+        print(f"🌐 Webhook: http://{host}:{port}{self.path} (воркеров: {self.workers})")
+
+        try:
+            await stop.wait()
+        except (asyncio.CancelledError, KeyboardInterrupt):
+            print("🛑 Получен Ctrl+C")
+            raise
+        finally:
+            print("🛑 Остановка: дообрабатываем очередь апдейтов...")
+            # Сначала закрываем прием, потом ждем очередь, потом закрываем HTTP
+            await self.drain()
+            await runner.cleanup()
+            await self.dp.emit_shutdown(bot=self.bot, **workflow_data)
+            await self.bot.session.close()
+            print(f"✅ Обработано апдейтов: {self.stats['processed']}, ошибок: {self.stats['failed']}")
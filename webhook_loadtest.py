@@ -0,0 +1,175 @@
+import json
+import time
+import random
+import asyncio
+import argparse
+
+import aiohttp
+from aiohttp import web
+
+from webhook import SECRET_HEADER
+
+# Фразы для синтетических апдейтов (если не передан файл с записанными апдейтами)
+PHRASES = [
+    "помыл пол", "сделал зарядку", "спроектировал спорткар", "приготовил завтрак",
+    "подготовил доклад по искусственному интеллекту", "отремонтировал старый велосипед своими руками",
+    "выучил двадцать новых слов на испанском", "собрал компьютер из комплектующих",
+]
+# id пользователей нагрузочного теста (не пересекаются с реальными)
+FIRST_USER_ID = 10_000_000
+
+
+def synthetic_updates(count, users):
+    """Сообщения от users разных пользователей, как их присылает Telegram."""
+    now = int(time.time())
+    for i in range(count):
+        user_id = FIRST_USER_ID + i % users
+        yield {
+            "update_id": i + 1,
+            "message": {
+                "message_id": i + 1,
+                "date": now,
+                "chat": {"id": user_id, "type": "private", "first_name": "load"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "load", "username": f"load{user_id}"},
+                "text": random.choice(PHRASES),
+            },
+        }
+
+
+def recorded_updates(path):
+    """Записанные апдейты: JSON Lines, по одному Update на строку."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class FakeBotAPI:
+    """Заглушка Bot API: отвечает на любые методы и считает ответы пользователям.
+
+    Бот запускается с TELEGRAM_API_URL=http://127.0.0.1:<порт>, тогда
+    время до ответа пользователю можно замерить без Telegram.
+    """
+
+    def __init__(self, user_ids):
+        self.user_ids = user_ids
+        self.replies = 0
+        self.calls = {}
+        self.last_reply = None
+        self.done = asyncio.Event()
+        self.expected = None
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        data = await request.post()
+        if method != "sendMessage":
+            return web.json_response({"ok": True, "result": True})
+
+        chat_id = int(data.get("chat_id", 0))
+        if chat_id in self.user_ids:
+            self.replies += 1
+            self.last_reply = time.perf_counter()
+            if self.expected and self.replies >= self.expected:
+                self.done.set()
+        return web.json_response({"ok": True, "result": {
+            "message_id": sum(self.calls.values()), "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "text": data.get("text", ""),
+        }})
+
+    async def start(self, port):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        return runner
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))]
+
+
+async def load_test(url, updates, concurrency, secret=None, api_port=None, wait_replies=60.0):
+    """POST апдейтов с concurrency одновременными запросами.
+
+    Возвращает скорость приема (HTTP 200) и, если поднята заглушка Bot API,
+    скорость полной обработки — до ответа пользователю.
+    """
+    user_ids = {update["message"]["chat"]["id"] for update in updates if "message" in update}
+    fake_api, runner = None, None
+    if api_port:
+        fake_api = FakeBotAPI(user_ids)
+        fake_api.expected = len(updates)
+        runner = await fake_api.start(api_port)
+
+    headers = {SECRET_HEADER: secret} if secret else {}
+    statuses, latencies = {}, []
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+
+    async def sender(session):
+        while not queue.empty():
+            update = queue.get_nowait()
+            start = time.perf_counter()
+            async with session.post(url, json=update, headers=headers) as response:
+                await response.read()
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(sender(session) for _ in range(concurrency)))
+        sent = time.perf_counter() - started
+
+    result = {
+        "updates": len(updates),
+        "concurrency": concurrency,
+        "statuses": statuses,
+        "accepted_per_s": round(statuses.get(200, 0) / sent, 1),
+        "http_p50_ms": round(percentile(latencies, 50), 3),
+        "http_p99_ms": round(percentile(latencies, 99), 3),
+    }
+    if fake_api:
+        try:
+            await asyncio.wait_for(fake_api.done.wait(), wait_replies)
+        except asyncio.TimeoutError:
+            pass
+        if fake_api.replies:
+            result["replies"] = fake_api.replies
+            result["processed_per_s"] = round(fake_api.replies / (fake_api.last_reply - started), 1)
+        result["api_calls"] = fake_api.calls
+        await runner.cleanup()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест webhook-режима бота")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default=None, help="WEBHOOK_SECRET бота")
+    parser.add_argument("--updates", type=int, default=2000, help="число синтетических апдейтов")
+    parser.add_argument("--users", type=int, default=200, help="разных пользователей среди них")
+    parser.add_argument("--updates-file", help="записанные апдейты (JSON Lines) вместо синтетических")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--fake-api-port", type=int, default=None,
+                        help="поднять заглушку Bot API (бот запущен с TELEGRAM_API_URL на этот порт)")
+    parser.add_argument("--json", help="сохранить результат в JSON")
+    args = parser.parse_args()
+
+    if args.updates_file:
+        updates = list(recorded_updates(args.updates_file))
+    else:
+        updates = list(synthetic_updates(args.updates, args.users))
+    result = asyncio.run(load_test(args.url, updates, args.concurrency, args.secret, args.fake_api_port))
+
+    print(f"📨 Апдейтов: {result['updates']}, одновременно: {result['concurrency']}, статусы: {result['statuses']}")
+    print(f"⚡ Прием: {result['accepted_per_s']} апдейтов/с | HTTP p50 {result['http_p50_ms']} ms, "
+          f"p99 {result['http_p99_ms']} ms")
+    if "processed_per_s" in result:
+        print(f"✅ До ответа пользователю: {result['replies']} ответов, {result['processed_per_s']} апдейтов/с")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)